@@ -1,45 +1,100 @@
 from fastapi import FastAPI
-import aio_pika
-from aio_pika.pool import Pool
 import logging
 from contextlib import asynccontextmanager
 from app.utils.logging import setup_logging
 from app.routes.alerts import create_alert_router
 from app.routes.queues import create_queue_router
 from app.routes.services import create_service_router
-from app.utils.config import load_config
-from app.utils.rabbitmq import init_connection_pool, close_connection_pool, listen_queues
+from app.routes.admin import create_admin_router
+from app.routes.metrics import create_metrics_router
+from app.utils.config import get_config
+from app.utils.broker import init_broker, close_broker, listen_queues
+from app.utils.outbox import init_outbox, close_outbox
+from app.utils.ingest import init_ingest_buffer, close_ingest_buffer
+from app.utils.status import init_status_store, close_status_store
+from app.utils.circuit import resume_held_deliveries, close_circuit_breakers
+from app.utils.http import init_http_client, close_http_client
+from app.utils.smtp import init_smtp_pool, close_smtp_pool
+from app.utils.reload import start_config_reloading, stop_config_reloading
 
 # Load configuration
-config = load_config()
+config = get_config()
 setup_logging()
 
 # Setup lifespan events 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global connection_pool
     try:
-        logging.info("Initializing RabbitMQ connection pool")
-        # Initialize the RabbitMQ connection pool
-        connection_pool = await init_connection_pool()
-        
-        # Start listening to queues using the initialized connection pool
-        await listen_queues()
+        # Open the store recording the delivery status of each alert
+        await init_status_store()
+
+        logging.info("Initializing message broker")
+        # Initialize the broker selected in the configuration, RabbitMQ by default
+        await init_broker()
+
+        # Open the outbox that holds alerts while the broker is unreachable
+        await init_outbox()
+
+        # Start the buffer that publishes fast-acked alerts in micro-batches
+        await init_ingest_buffer()
+
+        if config.get('api_only', False):
+            # Deliveries are left to separate `app.worker` processes
+            if config.get('broker', 'rabbitmq') == 'memory':
+                logging.warning("api_only is set with the memory broker, alerts will not be delivered")
+            logging.info("Running in API-only mode, not consuming queues")
+        else:
+            # Initialize the shared HTTP client used by the webhook handlers
+            await init_http_client()
+
+            # Initialize the SMTP session pool used by the email handler
+            await init_smtp_pool()
+
+            # Start listening to queues through the initialized broker
+            await listen_queues()
+
+            # Replay deliveries held while a destination was down
+            resume_held_deliveries()
+
+        # Reload the configuration on SIGHUP or when the file changes
+        start_config_reloading()
         
         #logging.info("Startup completed successfully")
         logging.info("FastAPI app initialized and ready to handle requests")
     except Exception as e:
-        logging.error(f"Failed to start application: {e}")
+        logging.error("Failed to start application: %s", e)
         raise
     yield
     try:
-        logging.info("Closing RabbitMQ connection pool")
-        # Close the RabbitMQ connection pool
-        await close_connection_pool()
+        await stop_config_reloading()
+
+        logging.info("Closing ingest buffer")
+        # Publish the alerts already accepted, spooling them if the broker is down
+        await close_ingest_buffer()
+
+        logging.info("Closing outbox")
+        # Spooled alerts stay on disk and are drained after the next start
+        await close_outbox()
+
+        logging.info("Stopping circuit breaker recovery")
+        await close_circuit_breakers()
+
+        logging.info("Closing message broker")
+        # Stop the consumers and close the broker
+        await close_broker()
+
+        logging.info("Closing HTTP client")
+        await close_http_client()
+
+        logging.info("Closing SMTP pool")
+        await close_smtp_pool()
+
+        logging.info("Closing delivery status store")
+        await close_status_store()
         
         logging.info("Shutdown completed successfully")
     except Exception as e:
-        logging.error(f"Failed to shut down application: {e}")
+        logging.error("Failed to shut down application: %s", e)
         raise
 
 # Initialize the FastAPI application with metadata from the configuration
@@ -50,12 +105,11 @@ app = FastAPI(
     lifespan=lifespan
 )
 
-# Global variable to hold the connection pool for RabbitMQ
-connection_pool: Pool[aio_pika.Connection] = None
-
 # Register routers with the FastAPI application
 logging.info("Registering routes for alerts, queues, and alert routers")
 create_alert_router(app)
 create_queue_router(app)
 create_service_router(app)
+create_admin_router(app)
+create_metrics_router(app)
 
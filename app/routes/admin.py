@@ -0,0 +1,26 @@
+import logging
+from fastapi import FastAPI, HTTPException, Depends
+from app.utils.auth import validate_api_key
+from app.utils.reload import reload_config
+
+logger = logging.getLogger(__name__)
+
+def create_admin_router(app: FastAPI) -> None:
+    """Create the admin router."""
+    @app.post("/admin/reload", summary="Reload the configuration")
+    async def reload(api_key: str = Depends(validate_api_key)):
+        """
+        Reload config.yaml without restarting the application.
+
+        Returns:
+            dict: The names of the queues whose consumers were started and stopped.
+
+        Raises:
+            HTTPException: If the new configuration is invalid. The current configuration is kept.
+        """
+        try:
+            result = await reload_config()
+        except Exception as e:
+            logger.error("Failed to reload configuration: %s", e)
+            raise HTTPException(status_code=400, detail=f"Invalid configuration: {e}")
+        return {"message": "Configuration reloaded", **result}
@@ -1,59 +1,112 @@
+import asyncio
 import logging
-from fastapi import FastAPI, HTTPException, Depends
-import aio_pika
-from app.schemas.alerts import Alert
-from app.utils.config import load_config
+import time
+from collections import defaultdict
+from typing import List
+from fastapi import FastAPI, HTTPException, Depends, Response
+from app.schemas.alerts import Alert, AlertResult, AlertStatus
+from app.utils import metrics
 from app.utils.auth import validate_api_key
-from app.utils.rabbitmq import get_connection_pool
+from app.utils.config import get_config
+from app.utils.logging import SAMPLED
+from app.utils.dedup import get_deduplicator, alert_fingerprint
+from app.utils.envelope import ALERT_ID_HEADER, encode_alert, new_alert_id
+from app.utils.ingest import BufferFull, get_ingest_buffer
+from app.utils.lanes import PRIORITY_HEADER, alert_route
+from app.utils.ratelimit import enforce_rate_limit, enforce_batch_rate_limit, check_queue_load, is_queue_overloaded
+from app.utils.broker import get_broker
+from app.utils.outbox import OutboxFull, get_outbox
+from app.utils.status import get_status_store
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Load configuration at module level for efficiency
-config = load_config()
-
-# Create a set of valid queue IDs for quick lookup
-valid_queue_ids = {queue['id'] for queue in config['queues']}
-
 def validate_queue(queue_id: str) -> bool:
     """Validate the queue id."""
-    logger.debug(f"Validating queue ID: {queue_id}")
-    return queue_id in valid_queue_ids
+    logger.debug("Validating queue ID: %s", queue_id)
+    return queue_id in get_config().queues_by_id
+
+def alert_message(alert: Alert, service_ids: list, priority: int = None, alert_id: str = None) -> tuple[bytes, dict]:
+    """Encode an alert in its message envelope, with service_ids, its priority and its id in the headers."""
+    body, headers = encode_alert(alert)
+    headers['service_ids'] = service_ids
+    if priority is not None:
+        headers[PRIORITY_HEADER] = priority
+    if alert_id is not None:
+        headers[ALERT_ID_HEADER] = alert_id
+    return body, headers
+
+def record_alert(alert: Alert, alert_id: str, queue_name: str) -> None:
+    """Record an accepted alert in the delivery status store, if it is enabled."""
+    status_store = get_status_store()
+    if status_store:
+        severity = alert.severity.value if alert.severity else None
+        status_store.record_alert(alert_id, alert.queue_id, queue_name, alert.title, severity)
+
+async def publish_alert(alert: Alert, queue_name: str, service_ids: list, priority: int = None,
+                        alert_id: str = None) -> bool:
+    """
+    Publish an alert to the broker.
+
+    If the outbox is enabled, an alert that fails to publish within the
+    outbox's publish timeout is spooled to it instead, as is every alert
+    while earlier ones are still spooled, so they are delivered in order.
+
+    Returns:
+        bool: True if the alert was spooled to the outbox rather than published.
+
+    Raises:
+        OutboxFull: If the alert had to be spooled and the outbox is full.
+    """
+    message_body, headers = alert_message(alert, service_ids, priority, alert_id)
+    logger.debug("Message body: %s", message_body)
+
+    outbox = get_outbox()
+    if outbox and outbox.active:
+        await outbox.append(queue_name, message_body, headers)
+        return True
 
-async def publish_alert(alert: Alert, queue_name: str, service_ids: list) -> None:
-            
-    """Publish an alert to RabbitMQ."""
     try:
-        
-        conn_pool = get_connection_pool()
-        async with conn_pool.acquire() as connection:
-            channel = await connection.channel()
-            # Declare a queue to ensure it exists
-            logger.info(f"Declaring queue: {queue_name}")
-            await channel.declare_queue(queue_name)
-
-            # Convert the alert to JSON and encode it as bytes
-            message_body = (alert.model_dump_json()).encode("utf-8")
-            logger.debug(f"Message body: {message_body}")
-
-            # Publish the message to the queue with service_ids in headers
-            logger.info(f"Publishing message to queue: {queue_name} with routing key: {queue_name}")
-            await channel.default_exchange.publish(
-                aio_pika.Message(body=message_body, headers={'service_ids': service_ids}),
-                routing_key=queue_name
-            )
-
-            # Explicitly close the channel after publishing
-            await channel.close()
+        # Publish the message to the queue with service_ids in headers.
+        # With publisher confirms enabled this waits for the broker to
+        # accept the message and raises if it is nacked.
+        logger.info("Publishing message to queue: %s with routing key: %s", queue_name, queue_name, extra=SAMPLED)
+        publish = get_broker().publish(
+            queue_name, message_body, headers, timings=metrics.alert_request_seconds
+        )
+        await (asyncio.wait_for(publish, outbox.publish_timeout) if outbox else publish)
     except Exception as e:
-        logger.error(f"Error publishing alert: {e}", exc_info=True)
-        raise
+        if not outbox:
+            logger.error("Error publishing alert: %s", e, exc_info=True)
+            raise
+        logger.warning("Error publishing alert, spooling it to the outbox: %s", str(e) or type(e).__name__)
+        await outbox.append(queue_name, message_body, headers)
+        return True
+    return False
+
+async def publish_alerts(alerts: List[Alert], queue_name: str, service_ids: list, priorities: list = None,
+                         alert_ids: list = None) -> list:
+    """
+    Publish several alerts for the same queue to the broker in one batch.
+
+    With RabbitMQ the whole group is published over one channel and costs
+    roughly one broker round trip.
+
+    Returns:
+        list: One entry per alert, either None if it was published or the exception raised.
+    """
+    logger.info("Publishing %s messages to queue: %s", len(alerts), queue_name)
+    messages = [
+        alert_message(alert, service_ids, priority, alert_id)
+        for alert, priority, alert_id in zip(
+            alerts, priorities or [None] * len(alerts), alert_ids or [None] * len(alerts)
+        )
+    ]
+    return await get_broker().publish_batch(queue_name, messages)
 
 def create_alert_router(app: FastAPI) -> None:
     """Create the alert router."""
     @app.post("/alert/")
-    async def create_alert(alert: Alert, api_key: str = Depends(validate_api_key)):
+    async def create_alert(alert: Alert, response: Response, api_key: str = Depends(enforce_rate_limit)):
         """
         Create an alert and publish it to the specified queue.
 
@@ -61,29 +114,208 @@ def create_alert_router(app: FastAPI) -> None:
             alert (Alert): The alert data to be published.
         
         Returns:
-            dict: A success message along with the created alert if successful.
+            dict: A success message along with the id assigned to the alert and,
+            unless in fast-ack mode, the created alert. The response is a 202 if
+            the alert was spooled to the outbox, or in fast-ack mode once it is buffered.
         
         Raises:
-            HTTPException: If the provided queue ID is invalid.
+            HTTPException: If the provided queue ID is invalid, the queue is overloaded,
+            or the outbox or ingest buffer is full.
         """
+        start = time.perf_counter()
         try:
             # Validate the queue_id in the alert
             if not validate_queue(alert.queue_id):
-                logger.error(f"Invalid queue ID: {alert.queue_id}")
+                logger.error("Invalid queue ID: %s", alert.queue_id)
                 raise HTTPException(status_code=400, detail="Invalid queue id.")
             
             # Find the queue details
-            queue_details = next((queue for queue in config['queues'] if queue['id'] == alert.queue_id), None)
+            queue_details = get_config().queues_by_id.get(alert.queue_id)
             if not queue_details:
-                logger.error(f"No details found for queue ID: {alert.queue_id}")
+                logger.error("No details found for queue ID: %s", alert.queue_id)
                 raise HTTPException(status_code=400, detail="No details found for queue id.")
+
+            # Route critical alerts to the queue's critical lane, if it has one
+            queue_name, priority = alert_route(alert, queue_details)
+
+            # Shed load if the queue's backlog is over the threshold
+            check_queue_load(queue_name)
+
+            # Suppress alerts already received within the deduplication window
+            deduplicator = get_deduplicator()
+            if deduplicator:
+                fingerprint = alert_fingerprint(alert)
+                if deduplicator.check(fingerprint):
+                    logger.info("Suppressed duplicate alert for queue: %s", alert.queue_id)
+                    return {"message": "Duplicate alert suppressed", "alert": alert}
             
+            metrics.alert_request_seconds.observe(time.perf_counter() - start, 'validation')
+            alert_id = new_alert_id()
+
+            # In fast-ack mode, buffer the alert and answer before it is published
+            ingest_buffer = get_ingest_buffer()
+            if ingest_buffer is not None:
+                body, headers = alert_message(alert, queue_details.get('service_ids', []), priority, alert_id)
+                try:
+                    ingest_buffer.submit(queue_name, body, headers)
+                except BufferFull:
+                    if deduplicator:
+                        deduplicator.forget(fingerprint)
+                    raise HTTPException(
+                        status_code=503,
+                        detail="Ingest buffer is full",
+                        headers={"Retry-After": str(get_config()['fast_ack'].get('retry_after', 1))}
+                    )
+                record_alert(alert, alert_id, queue_name)
+                response.status_code = 202
+                return {"message": "Alert accepted", "id": alert_id}
+
             # Publish the alert
-            logger.info(f"Publishing alert to queue: {alert.queue_id}")
-            await publish_alert(alert, queue_details['name'], queue_details.get('service_ids', []))
+            logger.info("Publishing alert to queue: %s", alert.queue_id, extra=SAMPLED)
+            try:
+                spooled = await publish_alert(
+                    alert, queue_name, queue_details.get('service_ids', []), priority, alert_id
+                )
+            except Exception as e:
+                # Let the caller retry an alert that was never published
+                if deduplicator:
+                    deduplicator.forget(fingerprint)
+                if isinstance(e, OutboxFull):
+                    raise HTTPException(status_code=503, detail="Broker unavailable and outbox full.")
+                raise
+
+            record_alert(alert, alert_id, queue_name)
+
+            if spooled:
+                logger.info("Alert spooled to the outbox")
+                response.status_code = 202
+                return {"message": "Alert accepted and spooled for publishing", "id": alert_id, "alert": alert}
             
-            logger.info("Alert published successfully")
-            return {"message": "Alert published successfully", "alert": alert.dict()}
+            logger.info("Alert published successfully", extra=SAMPLED)
+            return {"message": "Alert published successfully", "id": alert_id, "alert": alert}
+        except HTTPException:
+            raise
         except Exception as e:
-            logger.error(f"Error processing alert: {e}", exc_info=True)
+            logger.error("Error processing alert: %s", e, exc_info=True)
             raise HTTPException(status_code=500, detail="Internal server error")
+
+
+    @app.post("/alerts/batch", response_model=List[AlertResult])
+    async def create_alert_batch(alerts: List[Alert], api_key: str = Depends(validate_api_key)):
+        """
+        Create several alerts and publish them to their queues.
+
+        Alerts are grouped by queue and each group is published over a single
+        channel. A failure for one alert does not fail the rest of the batch.
+        If the outbox is enabled, alerts that fail to publish are spooled to it.
+        Each alert costs one rate limit token, and alerts beyond the key's
+        available tokens fail individually.
+
+        Parameters:
+            alerts (List[Alert]): The alerts to be published.
+
+        Returns:
+            List[AlertResult]: The outcome for each submitted alert, in order.
+
+        Raises:
+            HTTPException: If the batch is larger than the configured maximum, or the key has no tokens left.
+        """
+        config = get_config()
+        max_batch_size = config.get('max_batch_size', 1000)
+        if len(alerts) > max_batch_size:
+            logger.error("Batch of %s alerts exceeds maximum of %s", len(alerts), max_batch_size)
+            raise HTTPException(status_code=413, detail=f"Batch exceeds maximum of {max_batch_size} alerts.")
+        allowed = enforce_batch_rate_limit(api_key, len(alerts))
+
+        results = [None] * len(alerts)
+        alert_ids = [new_alert_id() for _ in alerts]
+        deduplicator = get_deduplicator()
+        fingerprints = [alert_fingerprint(alert) for alert in alerts] if deduplicator else None
+
+        # Group alerts by queue and lane, rejecting any with an unknown
+        # queue id and suppressing duplicates
+        groups = defaultdict(list)
+        for index, alert in enumerate(alerts):
+            if index >= allowed:
+                results[index] = AlertResult(index=index, status="failed", detail="Rate limit exceeded.")
+                continue
+            if not validate_queue(alert.queue_id):
+                results[index] = AlertResult(index=index, status="failed", detail="Invalid queue id.")
+                continue
+            if deduplicator and deduplicator.check(fingerprints[index]):
+                results[index] = AlertResult(index=index, status="duplicate")
+                continue
+            queue_name, _ = alert_route(alert, config.queues_by_id[alert.queue_id])
+            groups[(alert.queue_id, queue_name)].append(index)
+
+        async def publish_group(group, indexes):
+            queue_id, queue_name = group
+            queue_details = config.queues_by_id[queue_id]
+            if is_queue_overloaded(queue_name):
+                for index in indexes:
+                    results[index] = AlertResult(index=index, status="failed", detail="Queue is overloaded.")
+                    if deduplicator:
+                        deduplicator.forget(fingerprints[index])
+                return
+
+            service_ids = queue_details.get('service_ids', [])
+            priorities = [alert_route(alerts[index], queue_details)[1] for index in indexes]
+            outbox = get_outbox()
+            if outbox and outbox.active:
+                # Queue behind the alerts already spooled
+                outcomes = [RuntimeError("Outbox is draining")] * len(indexes)
+            else:
+                try:
+                    publish = publish_alerts(
+                        [alerts[index] for index in indexes], queue_name, service_ids, priorities,
+                        [alert_ids[index] for index in indexes]
+                    )
+                    outcomes = list(await (asyncio.wait_for(publish, outbox.publish_timeout) if outbox else publish))
+                except Exception as e:
+                    logger.error("Error publishing batch to queue %s: %s", queue_name, e, exc_info=True)
+                    outcomes = [e] * len(indexes)
+
+            if outbox:
+                # Spool the alerts that were not published, committed together
+                failed = [
+                    i for i, outcome in enumerate(outcomes) if isinstance(outcome, BaseException)
+                ]
+                spooled = await asyncio.gather(*(
+                    outbox.append(
+                        queue_name, *alert_message(alerts[indexes[i]], service_ids, priorities[i], alert_ids[indexes[i]])
+                    )
+                    for i in failed
+                ), return_exceptions=True)
+                for i, outcome in zip(failed, spooled):
+                    outcomes[i] = outcome if isinstance(outcome, BaseException) else "spooled"
+
+            for index, outcome in zip(indexes, outcomes):
+                if isinstance(outcome, BaseException):
+                    results[index] = AlertResult(index=index, status="failed", detail="Failed to publish alert.")
+                    if deduplicator:
+                        deduplicator.forget(fingerprints[index])
+                    continue
+                record_alert(alerts[index], alert_ids[index], queue_name)
+                status = "spooled" if outcome == "spooled" else "published"
+                results[index] = AlertResult(index=index, id=alert_ids[index], status=status)
+
+        await asyncio.gather(*(publish_group(group, indexes) for group, indexes in groups.items()))
+
+        logger.info("Processed batch of %s alerts across %s queues", len(alerts), len(groups))
+        return results
+
+    @app.get("/alert/{alert_id}", response_model=AlertStatus)
+    async def get_alert_status(alert_id: str, api_key: str = Depends(validate_api_key)):
+        """
+        Retrieve an alert and the status of its delivery to each service.
+
+        Parameters:
+        - **alert_id**: The id returned when the alert was created.
+        """
+        status_store = get_status_store()
+        if not status_store:
+            raise HTTPException(status_code=404, detail="Delivery status tracking is not enabled.")
+        status = await status_store.get(alert_id)
+        if not status:
+            raise HTTPException(status_code=404, detail="Alert Not Found")
+        return status
@@ -0,0 +1,12 @@
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from app.utils.metrics import render_metrics
+
+def create_metrics_router(app: FastAPI) -> None:
+    """Create the metrics router."""
+    @app.get("/metrics", response_class=PlainTextResponse, summary="Prometheus metrics")
+    async def metrics():
+        """
+        Expose ingest, broker and delivery metrics in the Prometheus text format.
+        """
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -1,20 +1,7 @@
 from fastapi import FastAPI, HTTPException, Depends
-from app.utils.config import load_config
+from app.utils.config import get_config
 from app.utils.auth import validate_api_key
 from app.schemas.queues import Queue
-import logging
-from app.utils.logging import setup_logging
-
-# Initialize logger
-setup_logging()
-config = load_config()
-
-# Ensure queues are loaded correctly
-try:
-    queues = config["queues"]
-except KeyError as e:
-    logging.error(f"Configuration error: {e}")
-    raise SystemExit("Failed to load queues configuration")
 
 def create_queue_router(app: FastAPI):
     @app.get("/queues", response_model=list[Queue], summary="List all queues")
@@ -22,7 +9,7 @@ def create_queue_router(app: FastAPI):
         """
         Retrieve a list of all queues.
         """
-        return queues
+        return get_config()['queues']
     
     @app.get("/queues/{queue_id}", response_model=Queue, summary="Get a queue by ID")
     async def get_queue(queue_id: int, api_key: str = Depends(validate_api_key)):
@@ -32,7 +19,7 @@ def create_queue_router(app: FastAPI):
         Parameters:
         - **queue_id**: The unique identifier of the queue.
         """
-        selected_queue = next((queue for queue in queues if queue["id"] == queue_id), None)
+        selected_queue = get_config().queues_by_id.get(queue_id)
         if not selected_queue: 
             raise HTTPException(status_code=404, detail="Queue Not Found")
         return selected_queue
\ No newline at end of file
@@ -21,6 +21,7 @@ class Alert(BaseModel):
     severity: Optional[Severity] = Field(None, description="The severity level of the alert (must be one of 'ok', 'info', 'warning', 'critical')")
     url: Optional[str] = Field(None, description="A URL associated with the alert")
     tagged_users: Optional[List[TaggedUser]] = Field(None, description="A list of users to tag in the alert - functionality depends on platform.")
+    dedup_key: Optional[str] = Field(None, description="A key identifying repeats of the same alert, used instead of the title and severity for deduplication")
 
     class Config:
         json_schema_extra = {
@@ -31,4 +32,28 @@ class Alert(BaseModel):
                 "severity": "critical",
                 "url": "https://example.com/alert/1"
             }
-        }
\ No newline at end of file
+        }
+
+class AlertResult(BaseModel):
+    index: int = Field(description="The position of the alert in the submitted batch")
+    id: Optional[str] = Field(None, description="The id assigned to the alert, if it was accepted")
+    status: str = Field(description="The outcome for the alert ('published', 'spooled', 'duplicate' or 'failed')")
+    detail: Optional[str] = Field(None, description="The reason the alert was not published, if it failed")
+
+class DeliveryStatus(BaseModel):
+    service_id: int = Field(description="The unique identifier of the service")
+    service_type: Optional[str] = Field(None, description="The type of the service")
+    status: str = Field(description="The outcome of the last delivery attempt ('delivered', 'failed', 'parked', or 'held' while the destination's circuit breaker is open)")
+    attempts: int = Field(description="The number of delivery attempts")
+    latency: Optional[float] = Field(None, description="The duration of the last delivery attempt in seconds")
+    last_error: Optional[str] = Field(None, description="The error of the last failed delivery attempt")
+    updated: float = Field(description="The time of the last delivery attempt, as a Unix timestamp")
+
+class AlertStatus(BaseModel):
+    id: str = Field(description="The id assigned to the alert when it was received")
+    queue_id: Optional[int] = Field(None, description="The unique identifier of the queue the alert was sent to")
+    queue_name: Optional[str] = Field(None, description="The name of the queue the alert was published to")
+    title: Optional[str] = Field(None, description="The title of the alert")
+    severity: Optional[str] = Field(None, description="The severity level of the alert")
+    received: float = Field(description="The time the alert was received, as a Unix timestamp")
+    deliveries: List[DeliveryStatus] = Field(description="The delivery status for each service the alert was delivered to")
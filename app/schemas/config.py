@@ -0,0 +1,35 @@
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+from typing import List, Literal, Optional
+from app.schemas.queues import Queue
+from app.schemas.services import Service
+
+class ServiceConfig(Service):
+    # Services can carry handler settings such as rate_limit
+    model_config = ConfigDict(extra="allow")
+
+    authorization: Optional[str] = Field(None, description="The authorization header sent with Zoom webhooks")
+
+class AppConfig(BaseModel):
+    """
+    Schema used to validate config.yaml. Settings not listed here are
+    optional and passed through unchanged.
+    """
+    model_config = ConfigDict(extra="allow")
+
+    title: str
+    description: str
+    debug_mode: bool = False
+    broker: Literal['rabbitmq', 'memory'] = 'rabbitmq'
+    rabbitmq_conn: Optional[str] = None
+    smtp_from_address: Optional[str] = None
+    smtp_server: Optional[str] = None
+    smtp_port: Optional[int] = None
+    api_keys: List[str]
+    queues: List[Queue]
+    services: Optional[List[ServiceConfig]] = None
+
+    @model_validator(mode='after')
+    def check_broker(self):
+        if self.broker == 'rabbitmq' and not self.rabbitmq_conn:
+            raise ValueError("rabbitmq_conn is required when the broker is rabbitmq")
+        return self
@@ -1,10 +1,14 @@
 from pydantic import BaseModel, Field
-from typing import List
+from typing import List, Optional
 
 class Queue(BaseModel):
     name: str = Field(description="The name of the queue")
     id: int = Field(description="The unique identifier for the queue")
     service_ids: List[int] = Field(description="A list of service IDs associated with the queue")
+    prefetch_count: Optional[int] = Field(None, description="The maximum number of unacknowledged messages delivered to the consumer")
+    max_concurrency: Optional[int] = Field(None, description="The maximum number of messages from the queue processed concurrently")
+    max_priority: Optional[int] = Field(None, ge=1, le=255, description="The maximum message priority, so more severe alerts are consumed first")
+    critical_concurrency: Optional[int] = Field(None, ge=1, description="The number of delivery slots reserved for critical alerts, consumed from a separate critical lane")
 
     class Config:
         json_schema_extra = {
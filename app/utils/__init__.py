@@ -1,6 +1,8 @@
 # app/utils/__init__.py
-from .config import load_config
+from .config import load_config, get_config, Config
 
 __all__ = [
-    'load_config'
+    'load_config',
+    'get_config',
+    'Config'
 ]
\ No newline at end of file
@@ -0,0 +1,396 @@
+import abc
+import asyncio
+import itertools
+import logging
+from app.utils import metrics
+from app.utils.config import get_config
+from app.utils.lanes import PRIORITY_HEADER, consumed_queues, priority_queue_arguments
+
+# Declaration arguments for queues that need them, keyed by queue name
+queue_arguments: dict[str, dict] = {}
+
+class Broker(abc.ABC):
+    """
+    The interface between the application and its message broker.
+
+    Consumed messages are passed to `gateway.on_message` and expose `body`,
+    `headers`, `routing_key`, `ack()` and `nack(requeue=...)`, as aio-pika's
+    incoming messages do. A message's priority is taken from its
+    `lanes.PRIORITY_HEADER` header.
+    """
+
+    # Running consumers keyed by queue name, each with an `in_flight` set of tasks
+    consumers: dict
+
+    # Whether this process consumes queues, so reloads only start consumers where they are wanted
+    consuming = False
+
+    @abc.abstractmethod
+    async def start(self) -> None:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def close(self) -> None:
+        """
+        Stops the consumers, letting in-flight deliveries finish, and releases the broker's resources.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def publish(self, queue_name: str, body: bytes, headers: dict = None,
+                      timings: metrics.Histogram = metrics.publish_seconds) -> None:
+        """
+        Publishes a message to a queue.
+
+        Args:
+            queue_name (str): The name of the queue to publish to.
+            body (bytes): The message body.
+            headers (dict): The headers to attach to the message.
+            timings (metrics.Histogram): The histogram recording the stages of the publish.
+
+        Raises:
+            Exception: If the broker did not accept the message.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def publish_batch(self, queue_name: str, messages: list) -> list:
+        """
+        Publishes several messages to the same queue.
+
+        Args:
+            queue_name (str): The name of the queue to publish to.
+            messages (list): (body, headers) tuples.
+
+        Returns:
+            list: One entry per message, either None if it was published or the exception raised.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def get(self, queue_name: str):
+        """
+        Takes the next message from a queue that is not consumed, such as a holding queue.
+
+        Returns:
+            The message, to be acknowledged like a consumed message, or None if the queue is empty.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_queue_depth(self, queue_name: str, max_age: float = 1) -> int:
+        """
+        Returns the last known number of messages waiting in a queue, without waiting on the broker.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def reconcile_consumers(self) -> tuple[list, list]:
+        """
+        Starts and stops consumers so they match the configured queues.
+
+        Returns:
+            tuple[list, list]: The names of the queues added and removed.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def stop_consumers(self, timeout: float = None) -> None:
+        raise NotImplementedError
+
+class MemoryMessage:
+    """
+    A message held by the memory broker.
+    """
+    __slots__ = ('body', 'headers', 'routing_key', 'sequence', 'redelivered', 'settled', 'on_settle', 'broker')
+
+    def __init__(self, broker: "MemoryBroker", routing_key: str, body: bytes, headers: dict, sequence: int):
+        self.broker = broker
+        self.routing_key = routing_key
+        self.body = body
+        self.headers = headers
+        self.sequence = sequence
+        self.redelivered = False
+        self.settled = False
+        self.on_settle = None
+
+    def settle(self) -> bool:
+        if self.settled:
+            return False
+        self.settled = True
+        if self.on_settle:
+            self.on_settle()
+            self.on_settle = None
+        return True
+
+    async def ack(self) -> None:
+        self.settle()
+
+    async def nack(self, requeue: bool = True) -> None:
+        if self.settle() and requeue:
+            self.settled = False
+            self.redelivered = True
+            self.broker.requeue(self)
+
+    async def reject(self, requeue: bool = False) -> None:
+        await self.nack(requeue)
+
+class MemoryConsumer:
+    """
+    Consumes a memory broker queue with the same prefetch and concurrency
+    limits as a RabbitMQ `QueueConsumer`.
+    """
+
+    def __init__(self, broker: "MemoryBroker", queue: dict):
+        self.broker = broker
+        self.name = queue['name']
+        self.max_concurrency = queue.get('max_concurrency') or get_config().get('default_max_concurrency', 10)
+        self.prefetch_count = queue.get('prefetch_count') or self.max_concurrency
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.prefetch = asyncio.Semaphore(self.prefetch_count)
+        self.in_flight: set[asyncio.Task] = set()
+        self.task: asyncio.Task = None
+        self.callback = None
+
+    def start(self) -> None:
+        # Imported here as the gateway publishes through the broker
+        from app.utils.gateway import on_message
+        from app.utils.retry import register_retry_queues
+        self.callback = on_message
+        register_retry_queues(self.name)
+        self.task = asyncio.create_task(self.consume())
+        logging.info(
+            "Consuming memory queue %s with prefetch=%s, max_concurrency=%s",
+            self.name, self.prefetch_count, self.max_concurrency
+        )
+
+    async def consume(self) -> None:
+        queue = self.broker.get_queue(self.name)
+        while True:
+            await self.prefetch.acquire()
+            try:
+                _, _, message = await queue.get()
+            except asyncio.CancelledError:
+                self.prefetch.release()
+                raise
+            message.on_settle = self.prefetch.release
+            task = asyncio.create_task(self.handle_message(message))
+            self.in_flight.add(task)
+            task.add_done_callback(self.in_flight.discard)
+
+    async def handle_message(self, message: MemoryMessage) -> None:
+        metrics.messages_consumed_total.inc(self.name)
+        try:
+            async with self.semaphore:
+                await self.callback(message)
+        except Exception as e:
+            logging.error("Unhandled error consuming message from %s: %s", self.name, e)
+            await message.nack(requeue=True)
+
+    async def stop(self, timeout: float = None) -> None:
+        """
+        Stops taking messages and waits for in-flight deliveries.
+        """
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        if self.in_flight:
+            await asyncio.wait(list(self.in_flight), timeout=timeout)
+        logging.info("Stopped consuming memory queue %s", self.name)
+
+class MemoryQueue(asyncio.PriorityQueue):
+    """
+    A priority queue whose size bound only applies to publishing.
+
+    Requeued and dead-lettered messages are always accepted, even past the
+    bound, as RabbitMQ never drops a message it already holds.
+    """
+
+    def __init__(self, maxsize: int = 0):
+        super().__init__(maxsize)
+        self.overflowing = False
+
+    def full(self) -> bool:
+        return not self.overflowing and super().full()
+
+    def put_past_bound(self, entry: tuple) -> None:
+        self.overflowing = True
+        try:
+            self.put_nowait(entry)
+        finally:
+            self.overflowing = False
+
+class MemoryBroker(Broker):
+    """
+    An in-process broker with bounded asyncio queues.
+
+    Messages are acknowledged or requeued as with RabbitMQ, and queues
+    declared with `x-message-ttl` and `x-dead-letter-routing-key` hold each
+    message for the TTL before moving it to the dead letter queue, so retry
+    tiers behave the same. On queues declared with `x-max-priority` higher
+    priority messages are consumed first, and otherwise messages are
+    consumed in the order they were published. A publish waits while the
+    queue holds `max_queue_size` messages, but requeued and dead-lettered
+    messages are never dropped. Messages are lost when the process exits.
+    """
+
+    def __init__(self, max_queue_size: int = 10000, publish_timeout: float = 5):
+        self.max_queue_size = max_queue_size
+        self.publish_timeout = publish_timeout
+        self.queues: dict[str, MemoryQueue] = {}
+        self.sequence = itertools.count()
+        self.consumers: dict[str, MemoryConsumer] = {}
+        self.delayed: set[asyncio.TimerHandle] = set()
+
+    async def start(self) -> None:
+        logging.info("Memory broker initialized with max_queue_size=%s", self.max_queue_size)
+
+    async def close(self) -> None:
+        await self.stop_consumers(get_config().get('shutdown_timeout', 30))
+        for handle in self.delayed:
+            handle.cancel()
+        self.delayed.clear()
+        undelivered = sum(queue.qsize() for queue in self.queues.values())
+        if undelivered:
+            logging.warning("Memory broker closed with %s undelivered messages", undelivered)
+        self.queues.clear()
+
+    def get_queue(self, queue_name: str) -> MemoryQueue:
+        queue = self.queues.get(queue_name)
+        if queue is None:
+            queue = MemoryQueue(self.max_queue_size)
+            self.queues[queue_name] = queue
+        return queue
+
+    def queue_entry(self, message: MemoryMessage) -> tuple:
+        """
+        Returns the entry queuing a message, ordered by priority and then by when it was first published.
+        """
+        max_priority = (queue_arguments.get(message.routing_key) or {}).get('x-max-priority')
+        priority = min(int(message.headers.get(PRIORITY_HEADER) or 0), max_priority) if max_priority else 0
+        return (-priority, message.sequence, message)
+
+    def requeue(self, message: MemoryMessage) -> None:
+        self.get_queue(message.routing_key).put_past_bound(self.queue_entry(message))
+
+    def dead_letter_later(self, message: MemoryMessage, queue_name: str, delay: float) -> None:
+        """
+        Moves a message to another queue after a delay, as RabbitMQ does when a message TTL expires.
+        """
+        def expire():
+            self.delayed.discard(handle)
+            message.routing_key = queue_name
+            self.requeue(message)
+
+        handle = asyncio.get_running_loop().call_later(delay, expire)
+        self.delayed.add(handle)
+
+    async def publish(self, queue_name: str, body: bytes, headers: dict = None,
+                      timings: metrics.Histogram = metrics.publish_seconds) -> None:
+        with timings.time('publish'):
+            message = MemoryMessage(self, queue_name, body, dict(headers or {}), next(self.sequence))
+            arguments = queue_arguments.get(queue_name) or {}
+            if 'x-message-ttl' in arguments:
+                self.dead_letter_later(
+                    message, arguments.get('x-dead-letter-routing-key', queue_name), arguments['x-message-ttl'] / 1000
+                )
+                return
+            await asyncio.wait_for(self.get_queue(queue_name).put(self.queue_entry(message)), self.publish_timeout)
+
+    async def publish_batch(self, queue_name: str, messages: list) -> list:
+        return await asyncio.gather(
+            *(self.publish(queue_name, body, headers) for body, headers in messages),
+            return_exceptions=True
+        )
+
+    async def get(self, queue_name: str) -> MemoryMessage:
+        queue = self.queues.get(queue_name)
+        if not queue or queue.empty():
+            return None
+        return queue.get_nowait()[2]
+
+    def get_queue_depth(self, queue_name: str, max_age: float = 1) -> int:
+        queue = self.queues.get(queue_name)
+        return queue.qsize() if queue else 0
+
+    async def reconcile_consumers(self) -> tuple[list, list]:
+        configured = consumed_queues(get_config())
+        added = [name for name in configured if name not in self.consumers]
+        removed = [name for name in self.consumers if name not in configured]
+
+        for name in removed:
+            await self.consumers.pop(name).stop(get_config().get('shutdown_timeout', 30))
+
+        for name in added:
+            consumer = MemoryConsumer(self, configured[name])
+            consumer.start()
+            self.consumers[name] = consumer
+
+        return added, removed
+
+    async def stop_consumers(self, timeout: float = None) -> None:
+        await asyncio.gather(*(consumer.stop(timeout) for consumer in self.consumers.values()))
+        self.consumers.clear()
+
+# Global variable to hold the broker in use
+broker: Broker = None
+
+messages_in_flight = metrics.Gauge(
+    "wuphf_messages_in_flight", "Consumed messages currently being delivered, by queue", ("queue",),
+    function=lambda: {
+        (name,): len(consumer.in_flight) for name, consumer in (broker.consumers if broker else {}).items()
+    }
+)
+
+def get_broker() -> Broker:
+    return broker
+
+def register_queue_priorities() -> None:
+    """
+    Registers `x-max-priority` for the configured queues that have a `max_priority`.
+
+    RabbitMQ fixes a queue's maximum priority when it is declared, so an
+    existing queue has to be deleted for a change to take effect.
+    """
+    queue_arguments.update(priority_queue_arguments(get_config()))
+
+async def init_broker() -> Broker:
+    """
+    Creates and starts the broker selected by the `broker` setting, RabbitMQ by default.
+    """
+    global broker
+    config = get_config()
+    register_queue_priorities()
+    if config.get('broker', 'rabbitmq') == 'memory':
+        settings = config.get('memory_broker') or {}
+        broker = MemoryBroker(
+            max_queue_size=settings.get('max_queue_size', 10000),
+            publish_timeout=settings.get('publish_timeout', 5)
+        )
+    else:
+        # Imported here as the RabbitMQ module builds on this interface
+        from app.utils.rabbitmq import RabbitMQBroker
+        broker = RabbitMQBroker()
+    await broker.start()
+    return broker
+
+async def close_broker() -> None:
+    global broker
+    if broker:
+        await broker.close()
+        broker = None
+
+async def listen_queues():
+    """
+    Starts a consumer for each configured queue.
+    """
+    try:
+        broker.consuming = True
+        await broker.reconcile_consumers()
+        logging.info("Queues and consumers set up successfully")
+    except Exception as e:
+        logging.error("Failed to set up queues and consumers: %s", e)
+        raise
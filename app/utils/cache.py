@@ -0,0 +1,61 @@
+import time
+from collections import OrderedDict
+
+# Returned by TTLCache.get when a key is not cached
+MISSING = object()
+
+class TTLCache:
+    """
+    A bounded in-memory cache whose entries expire after a time-to-live.
+
+    Entries are evicted in least recently used order once the cache is full.
+    A value of None can be cached, for example to remember a failed lookup,
+    so use `MISSING` to tell an uncached key from a cached None.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries: OrderedDict = OrderedDict()
+
+    def get(self, key, default=MISSING):
+        """
+        Returns the cached value for a key, or `default` if it is missing or expired.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return default
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self.entries[key]
+            return default
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: float = None) -> None:
+        """
+        Caches a value, optionally with a time-to-live other than the default.
+        """
+        self.entries[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        entry = self.entries.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    def resize(self, maxsize: int, ttl: float) -> None:
+        """
+        Changes the size and default time-to-live, keeping the cached entries and their expiry times.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self.entries)
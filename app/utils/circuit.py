@@ -0,0 +1,269 @@
+import asyncio
+import hashlib
+import logging
+import time
+from app.utils import metrics
+from app.utils.broker import get_broker
+from app.utils.config import get_config
+from app.utils.ratelimit import TokenBucket
+from app.utils.retry import BROKER_HEADERS
+
+# Circuit breaker states
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+STATE_VALUES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+# Message header recording the queue a held message is replayed to
+HELD_FROM_HEADER = 'x-held-from'
+
+def destination_key(services: list) -> tuple:
+    """
+    Returns the destination a group of services is delivered to.
+
+    Webhook services are keyed by their recipient URL. All SMTP services
+    share the SMTP relay, so they share one destination.
+    """
+    service = services[0]
+    if service['type'] == 'smtp':
+        return ('smtp', get_config().get('smtp_server'))
+    return (service['type'], service['recipient'])
+
+class CircuitBreaker:
+    """
+    Tracks the health of one destination and holds its deliveries while it is down.
+
+    While closed, deliveries go through and consecutive failures are
+    counted. After `failure_threshold` of them the breaker opens, and
+    deliveries to the destination are moved to its holding queue instead of
+    being attempted. Once `open_seconds` have passed it is half-open and a
+    single delivery is let through as a probe: success closes the breaker,
+    failure opens it again. A held message is sent back as the probe if no
+    new alert arrives, and once the breaker closes the held messages are
+    replayed to their queues at `replay_rate` per second.
+    """
+
+    def __init__(self, registry: "CircuitBreakers", key: tuple):
+        self.registry = registry
+        self.key = key
+        digest = hashlib.sha1("\0".join(str(part) for part in key).encode("utf-8")).hexdigest()[:12]
+        # The recipient may contain credentials, so it is only identified by a digest
+        self.name = f"{key[0]}.{digest}"
+        self.holding_queue = f"held.{self.name}"
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self.probing = False
+        self.changed = asyncio.Event()
+        self.recovery_task: asyncio.Task = None
+
+    def allow(self) -> bool:
+        """
+        Returns True if a delivery to the destination should be attempted now.
+        """
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.registry.open_seconds:
+            self.transition(HALF_OPEN)
+        if self.state == HALF_OPEN and not self.probing:
+            self.probing = True
+            return True
+        return self.state == CLOSED
+
+    def record_success(self) -> None:
+        self.failures = 0
+        if self.state != CLOSED:
+            self.transition(CLOSED)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.registry.failure_threshold):
+            self.opened_at = time.monotonic()
+            self.transition(OPEN)
+
+    def transition(self, state: str) -> None:
+        if state == OPEN:
+            logging.warning("Circuit breaker for %s opened after %s failures", self.name, self.failures)
+        else:
+            logging.info("Circuit breaker for %s is %s", self.name, state)
+        self.state = state
+        self.probing = False
+        metrics.circuit_breaker_transitions_total.inc(state)
+        # Wake up the recovery task waiting on the previous state
+        self.changed.set()
+        self.changed = asyncio.Event()
+        if state != HALF_OPEN:
+            self.start_recovery()
+
+    def start_recovery(self) -> None:
+        if self.registry.closed:
+            return
+        if self.recovery_task is None or self.recovery_task.done():
+            self.recovery_task = asyncio.create_task(self.recover())
+
+    async def hold(self, queue_name: str, body: bytes, headers: dict, service_ids: list) -> None:
+        """
+        Moves a delivery to the holding queue, to be replayed to `queue_name` once the breaker closes.
+        """
+        headers = {key: value for key, value in (headers or {}).items() if key not in BROKER_HEADERS}
+        headers['service_ids'] = service_ids
+        headers[HELD_FROM_HEADER] = queue_name
+        await get_broker().publish(self.holding_queue, body, headers)
+        metrics.deliveries_held_total.inc(self.key[0])
+        self.start_recovery()
+
+    async def release(self) -> bool:
+        """
+        Publishes the oldest held message back to its queue.
+
+        Returns:
+            bool: False if the holding queue is empty.
+        """
+        message = await get_broker().get(self.holding_queue)
+        if message is None:
+            return False
+        headers = {key: value for key, value in message.headers.items() if key not in BROKER_HEADERS}
+        queue_name = headers.pop(HELD_FROM_HEADER)
+        try:
+            await get_broker().publish(queue_name, message.body, headers)
+        except Exception:
+            await message.nack(requeue=True)
+            raise
+        await message.ack()
+        metrics.deliveries_replayed_total.inc(self.key[0])
+        return True
+
+    async def recover(self) -> None:
+        """
+        Probes the destination with a held message when the breaker can be
+        half-open, and replays the held messages once it has closed.
+        """
+        while True:
+            try:
+                if self.state == CLOSED:
+                    await self.replay()
+                    if self.state == CLOSED:
+                        return
+                    continue
+
+                remaining = self.registry.open_seconds - (time.monotonic() - self.opened_at)
+                if self.state == OPEN and remaining > 0:
+                    await asyncio.sleep(remaining)
+                    continue
+
+                # Send a held message to be the probe, unless a new alert already is
+                if not self.probing and not await self.release():
+                    # Nothing is held, so the next alert for the destination will probe it
+                    return
+                try:
+                    await asyncio.wait_for(self.changed.wait(), self.registry.open_seconds)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error("Failed to release held deliveries for %s: %s", self.name, e)
+                await asyncio.sleep(self.registry.open_seconds)
+
+    async def replay(self) -> None:
+        """
+        Replays the held messages at the configured rate while the breaker stays closed.
+        """
+        bucket = TokenBucket(self.registry.replay_rate, self.registry.replay_burst)
+        replayed = 0
+        while self.state == CLOSED:
+            wait = bucket.consume()
+            if wait:
+                await asyncio.sleep(wait)
+                continue
+            if not await self.release():
+                break
+            replayed += 1
+        if replayed:
+            logging.info("Replayed %s held deliveries for %s", replayed, self.name)
+
+class CircuitBreakers:
+    """
+    The circuit breakers of every destination, created as deliveries are made.
+    """
+
+    def __init__(self, settings: dict):
+        self.breakers: dict[tuple, CircuitBreaker] = {}
+        self.closed = False
+        self.configure(settings)
+
+    def configure(self, settings: dict) -> None:
+        self.settings = settings
+        self.failure_threshold = settings.get('failure_threshold', 5)
+        self.open_seconds = settings.get('open_seconds', 30)
+        self.replay_rate = settings.get('replay_rate', 5)
+        self.replay_burst = settings.get('replay_burst', self.replay_rate)
+
+    def get(self, services: list) -> CircuitBreaker:
+        key = destination_key(services)
+        breaker = self.breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(self, key)
+            self.breakers[key] = breaker
+        return breaker
+
+    def resume(self) -> None:
+        """
+        Starts replaying the deliveries held for the configured destinations, for example before a restart.
+        """
+        services = get_config().get('services') or []
+        groups = [[service] for service in services if service['type'] != 'smtp']
+        smtp_services = [service for service in services if service['type'] == 'smtp']
+        if smtp_services:
+            groups.append(smtp_services)
+        for group in groups:
+            self.get(group).start_recovery()
+
+    async def close(self) -> None:
+        self.closed = True
+        tasks = [breaker.recovery_task for breaker in self.breakers.values() if breaker.recovery_task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+# The circuit breakers and the settings they were configured from
+circuit_breakers: CircuitBreakers = None
+
+def get_circuit_breakers() -> CircuitBreakers:
+    """
+    Returns the circuit breakers, or None if circuit breaking is not enabled.
+    """
+    global circuit_breakers
+    settings = get_config().get('circuit_breaker')
+    if not settings or not settings.get('enabled', True):
+        return None
+    if circuit_breakers is None:
+        circuit_breakers = CircuitBreakers(settings)
+        logging.info("Circuit breakers enabled with a threshold of %s failures", circuit_breakers.failure_threshold)
+    elif settings is not circuit_breakers.settings:
+        # Keep the state of every breaker across a configuration reload
+        circuit_breakers.configure(settings)
+    return circuit_breakers
+
+def resume_held_deliveries() -> None:
+    """
+    Replays deliveries held by a previous run, if circuit breaking is enabled.
+    """
+    breakers = get_circuit_breakers()
+    if breakers:
+        breakers.resume()
+
+async def close_circuit_breakers() -> None:
+    """
+    Stops probing and replaying held deliveries. Held messages stay in their holding queues.
+    """
+    if circuit_breakers:
+        await circuit_breakers.close()
+
+circuit_breaker_state = metrics.Gauge(
+    "wuphf_circuit_breaker_state", "State of each destination's circuit breaker (0 closed, 1 open, 2 half-open)",
+    ("destination",),
+    function=lambda: {
+        (breaker.name,): STATE_VALUES[breaker.state]
+        for breaker in (circuit_breakers.breakers.values() if circuit_breakers else ())
+    }
+)
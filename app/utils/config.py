@@ -1,8 +1,14 @@
 # app/utils/config.py
 import yaml
+import hashlib
 import logging
+from types import MappingProxyType
+from app.schemas.config import AppConfig
 
-def load_config(config_file="config.yaml"):
+# The configuration file read at startup and on reload
+CONFIG_FILE = "config.yaml"
+
+def load_config(config_file=CONFIG_FILE):
     """
     Loads configuration settings from a YAML file.
 
@@ -21,8 +27,97 @@ def load_config(config_file="config.yaml"):
             config = yaml.safe_load(f)
             return config
     except FileNotFoundError:
-        logging.error(f"Configuration file {config_file} not found")
+        logging.error("Configuration file %s not found", config_file)
         raise FileNotFoundError(f"Configuration file {config_file} not found")
     except yaml.YAMLError as e:
-        logging.error(f"Error parsing YAML file {config_file}: {e}")
-        raise yaml.YAMLError(f"Error parsing YAML file {config_file}: {e}")
\ No newline at end of file
+        logging.error("Error parsing YAML file %s: %s", config_file, e)
+        raise yaml.YAMLError(f"Error parsing YAML file {config_file}: {e}")
+
+class Config:
+    """
+    The parsed and validated configuration, with indexes for routing.
+
+    Settings are read with item access, as with the dictionary returned by
+    `load_config`, after validation by `AppConfig` so its defaults apply.
+    Queues and services are indexed by id, and each queue id maps to the
+    services it routes to, so lookups on the hot path are O(1). API keys
+    map from their digest to their rate limit settings.
+    The object is not modified after it is built.
+    """
+
+    def __init__(self, settings: dict):
+        settings = AppConfig.model_validate(settings).model_dump()
+
+        services = settings.get('services') or []
+        queues = settings['queues']
+
+        self.settings = MappingProxyType(settings)
+        self.services_by_id = MappingProxyType({service['id']: service for service in services})
+        self.queues_by_id = MappingProxyType({queue['id']: queue for queue in queues})
+        self.queues_by_name = MappingProxyType({queue['name']: queue for queue in queues})
+        self.services_by_queue_id = MappingProxyType({
+            queue['id']: tuple(
+                self.services_by_id[service_id]
+                for service_id in queue.get('service_ids', [])
+                if service_id in self.services_by_id
+            )
+            for queue in queues
+        })
+
+        # API keys are indexed by digest so the raw keys are not kept around
+        rate_limits = settings.get('rate_limits') or {}
+        default_limit = rate_limits.get('default')
+        key_limits = rate_limits.get('keys') or {}
+        self.api_keys = MappingProxyType({
+            hash_api_key(api_key): key_limits.get(api_key, default_limit)
+            for api_key in settings['api_keys']
+        })
+
+        for queue in queues:
+            for service_id in queue.get('service_ids', []):
+                if service_id not in self.services_by_id:
+                    logging.warning("Queue %s references unknown service id %s", queue['name'], service_id)
+
+    def __getitem__(self, key):
+        return self.settings[key]
+
+    def __contains__(self, key):
+        return key in self.settings
+
+    def get(self, key, default=None):
+        return self.settings.get(key, default)
+
+def hash_api_key(api_key: str) -> str:
+    """
+    Returns the digest used to identify an API key.
+    """
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+# The configuration shared by the whole application
+config: Config = None
+
+def get_config() -> Config:
+    """
+    Returns the shared configuration, loading and validating it on first use.
+
+    Returns:
+        Config: The parsed configuration.
+    """
+    global config
+    if config is None:
+        config = Config(load_config())
+    return config
+
+def set_config(new_config: Config) -> None:
+    """
+    Replaces the shared configuration.
+
+    Callers read the configuration through `get_config`, so the swap is
+    atomic: each request or message sees either the old or the new routing
+    data, never a mix of both.
+
+    Args:
+        new_config (Config): The configuration to use from now on.
+    """
+    global config
+    config = new_config
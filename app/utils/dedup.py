@@ -0,0 +1,75 @@
+import hashlib
+import logging
+from app.schemas.alerts import Alert
+from app.utils import metrics
+from app.utils.cache import TTLCache, MISSING
+from app.utils.config import get_config
+
+class Deduplicator:
+    """
+    Suppresses alerts whose fingerprint was already seen within a time window.
+
+    Fingerprints are kept in a bounded cache with LRU and TTL eviction, so
+    memory use stays fixed however many distinct alerts arrive.
+    """
+
+    def __init__(self, window: float, max_entries: int):
+        self.seen = TTLCache(maxsize=max_entries, ttl=window)
+        self.suppressed = 0
+
+    def configure(self, window: float, max_entries: int) -> None:
+        """
+        Applies a new window and size, keeping the fingerprints already seen.
+        """
+        self.seen.resize(max_entries, window)
+
+    def check(self, fingerprint: str) -> bool:
+        """
+        Records a fingerprint and returns True if it is a duplicate.
+        """
+        if self.seen.get(fingerprint) is not MISSING:
+            self.suppressed += 1
+            metrics.alerts_suppressed_total.inc()
+            return True
+        self.seen.set(fingerprint, True)
+        return False
+
+    def forget(self, fingerprint: str) -> None:
+        """
+        Removes a fingerprint, for example when its alert failed to publish.
+        """
+        self.seen.pop(fingerprint)
+
+def alert_fingerprint(alert: Alert) -> str:
+    """
+    Returns the deduplication fingerprint of an alert.
+
+    The caller-supplied dedup key is used if set, otherwise the queue id,
+    title and severity are hashed.
+    """
+    if alert.dedup_key:
+        return f"{alert.queue_id}:{alert.dedup_key}"
+    severity = alert.severity.value if alert.severity else ""
+    return hashlib.sha1(f"{alert.queue_id}\0{alert.title}\0{severity}".encode("utf-8")).hexdigest()
+
+# The deduplicator and the settings it was built from
+deduplicator: Deduplicator = None
+deduplicator_settings: dict = None
+
+def get_deduplicator() -> Deduplicator:
+    """
+    Returns the deduplicator, or None if deduplication is not enabled.
+    """
+    global deduplicator, deduplicator_settings
+    settings = get_config().get('dedup')
+    if not settings or not settings.get('enabled', True):
+        return None
+    if deduplicator is None:
+        deduplicator = Deduplicator(settings.get('window_seconds', 300), settings.get('max_entries', 10000))
+        logging.info("Alert deduplication enabled with a %ss window", deduplicator.seen.ttl)
+    elif settings != deduplicator_settings:
+        # Each reload builds new settings, so only a change in value reconfigures the deduplicator
+        deduplicator.configure(settings.get('window_seconds', 300), settings.get('max_entries', 10000))
+        logging.info("Alert deduplication window is now %ss", deduplicator.seen.ttl)
+    deduplicator_settings = settings
+    return deduplicator
@@ -0,0 +1,123 @@
+import asyncio
+import logging
+from app.utils.config import get_config
+from app.utils.ratelimit import TokenBucket
+from app.utils.renderers import AlertRenderer
+
+class Destination:
+    """
+    The delivery state of one destination: its token bucket and the alerts
+    waiting for it while it is saturated.
+    """
+
+    def __init__(self, limits: dict):
+        self.limits = limits
+        self.bucket = TokenBucket(limits['rate'], limits.get('burst', limits['rate']))
+        self.pending: list[tuple[AlertRenderer, asyncio.Future]] = []
+        self.flush_task: asyncio.Task = None
+
+    def configure(self, limits: dict) -> None:
+        """
+        Applies new limits, keeping the tokens left and the alerts held for the destination.
+        """
+        self.limits = limits
+        self.bucket.configure(limits['rate'], limits.get('burst', limits['rate']))
+
+class Dispatcher:
+    """
+    Delivers alerts with a rate limit per destination.
+
+    While a destination has tokens, alerts are sent to it one by one. Once
+    it is saturated, alerts for it are held and sent as a single digest
+    listing all of them when the next token is available. Callers wait
+    until their alert has been sent, alone or in a digest, so delivery
+    failures are still reported per alert.
+    """
+
+    def __init__(self, send, send_digest):
+        """
+        Args:
+            send: Coroutine function taking (services, renderer) that sends one alert.
+            send_digest: Coroutine function taking (services, messages) that sends a digest.
+        """
+        self.send = send
+        self.send_digest = send_digest
+        self.destinations: dict[tuple, Destination] = {}
+
+    def get_destination(self, services: list) -> Destination:
+        """
+        Returns the destination for a group of services, or None if it is not rate limited.
+
+        Limits are taken from the first service's `rate_limit`, or else the
+        `dispatch` settings for its type.
+        """
+        service = services[0]
+        limits = service.get('rate_limit') or (get_config().get('dispatch') or {}).get(service['type'])
+        if not limits:
+            return None
+
+        key = (service['type'], tuple(sorted(service['recipient'] for service in services)))
+        destination = self.destinations.get(key)
+        if destination is None:
+            destination = Destination(limits)
+            self.destinations[key] = destination
+        elif destination.limits != limits:
+            # Each reload builds new limits, so only a change in value reconfigures the destination
+            destination.configure(limits)
+        return destination
+
+    async def dispatch(self, services: list, renderer: AlertRenderer) -> None:
+        """
+        Delivers an alert to a group of services, coalescing it into a digest if the destination is saturated.
+
+        Raises:
+            Exception: If the delivery, or the digest containing the alert, failed.
+        """
+        destination = self.get_destination(services)
+        if destination is None or (not destination.pending and not destination.bucket.consume()):
+            await self.send(services, renderer)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        destination.pending.append((renderer, future))
+        if destination.flush_task is None:
+            destination.flush_task = asyncio.create_task(self.flush(destination, services))
+        await future
+
+    async def flush(self, destination: Destination, services: list) -> None:
+        """
+        Sends the alerts held for a destination as tokens become available.
+        """
+        max_digest_size = (get_config().get('dispatch') or {}).get('max_digest_size', 50)
+        try:
+            while destination.pending:
+                wait = destination.bucket.consume()
+                while wait:
+                    await asyncio.sleep(wait)
+                    wait = destination.bucket.consume()
+
+                batch = destination.pending[:max_digest_size]
+                del destination.pending[:max_digest_size]
+                try:
+                    if len(batch) == 1:
+                        await self.send(services, batch[0][0])
+                    else:
+                        logging.info(
+                            "Sending digest of %s alerts to %s service id=%s",
+                            len(batch), services[0]['type'], services[0]['id']
+                        )
+                        await self.send_digest(services, [renderer.message for renderer, _ in batch])
+                except Exception as e:
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                else:
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_result(None)
+        finally:
+            destination.flush_task = None
+            # Only reached with alerts still held if the flush was cancelled
+            for _, future in destination.pending:
+                future.cancel()
+            destination.pending.clear()
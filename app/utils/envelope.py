@@ -0,0 +1,136 @@
+import logging
+import uuid
+import zlib
+import orjson
+from app.schemas.alerts import Alert, Severity
+from app.utils.config import get_config
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Version of the message envelope, bumped when the encoding changes incompatibly
+ENVELOPE_VERSION = 1
+
+# Message headers describing how the body is encoded
+VERSION_HEADER = 'x-envelope-version'
+CONTENT_TYPE_HEADER = 'content-type'
+CONTENT_ENCODING_HEADER = 'content-encoding'
+
+# Message header carrying the id assigned to an alert when it was received
+ALERT_ID_HEADER = 'x-alert-id'
+
+JSON_CONTENT_TYPE = 'application/json'
+MSGPACK_CONTENT_TYPE = 'application/msgpack'
+ZLIB_ENCODING = 'zlib'
+
+# Set once a missing msgpack package has been logged
+msgpack_warned = False
+
+# Severities parsed once per message, by their string value
+SEVERITIES = {severity.value: severity for severity in Severity}
+
+def new_alert_id() -> str:
+    return uuid.uuid4().hex
+
+class AlertMessage:
+    """
+    A decoded alert as handled by the consumers and renderers.
+
+    Built directly from the message body without validating it again, as
+    it was validated when the alert was received.
+    """
+    __slots__ = ('queue_id', 'title', 'message', 'severity', 'url', 'tagged_users', 'dedup_key')
+
+    def __init__(self, title: str, message: str, severity: Severity = None, url: str = None,
+                 tagged_users: list = None, queue_id: int = None, dedup_key: str = None):
+        self.queue_id = queue_id
+        self.title = title
+        self.message = message
+        self.severity = severity
+        self.url = url
+        self.tagged_users = tagged_users
+        self.dedup_key = dedup_key
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "AlertMessage":
+        severity = data.get('severity')
+        return cls(
+            title=data['title'],
+            message=data['message'],
+            severity=SEVERITIES.get(severity) if severity else None,
+            url=data.get('url'),
+            tagged_users=data.get('tagged_users'),
+            queue_id=data.get('queue_id'),
+            dedup_key=data.get('dedup_key')
+        )
+
+def envelope_settings() -> tuple[str, int]:
+    """
+    Returns the configured body format and compression threshold.
+    """
+    global msgpack_warned
+    settings = get_config().get('envelope') or {}
+    body_format = settings.get('format', 'json')
+    if body_format == 'msgpack' and msgpack is None:
+        if not msgpack_warned:
+            logging.warning("msgpack is not installed, publishing alerts as JSON")
+            msgpack_warned = True
+        body_format = 'json'
+    return body_format, settings.get('compress_threshold', 4096)
+
+def encode_alert(alert: Alert) -> tuple[bytes, dict]:
+    """
+    Encodes an alert as a message body and the headers describing it.
+
+    The body is JSON, or msgpack if configured, and is compressed with zlib
+    when it is larger than the compression threshold.
+
+    Returns:
+        tuple[bytes, dict]: The body and the envelope headers.
+    """
+    body_format, compress_threshold = envelope_settings()
+    if body_format == 'msgpack':
+        body = msgpack.packb(alert.model_dump(mode='json', exclude_none=True))
+        headers = {VERSION_HEADER: ENVELOPE_VERSION, CONTENT_TYPE_HEADER: MSGPACK_CONTENT_TYPE}
+    else:
+        body = alert.model_dump_json(exclude_none=True).encode("utf-8")
+        headers = {VERSION_HEADER: ENVELOPE_VERSION, CONTENT_TYPE_HEADER: JSON_CONTENT_TYPE}
+
+    if compress_threshold is not None and len(body) > compress_threshold:
+        compressed = zlib.compress(body)
+        if len(compressed) < len(body):
+            body = compressed
+            headers[CONTENT_ENCODING_HEADER] = ZLIB_ENCODING
+    return body, headers
+
+def decode_message(body: bytes, headers: dict) -> AlertMessage:
+    """
+    Decodes a message body into an `AlertMessage`.
+
+    Messages without envelope headers, published before the envelope was
+    introduced, are read as plain JSON.
+
+    Raises:
+        ValueError: If the envelope version, content type or encoding is not supported.
+    """
+    headers = headers or {}
+    version = headers.get(VERSION_HEADER)
+    if version is not None and int(version) > ENVELOPE_VERSION:
+        raise ValueError(f"Unsupported envelope version {version}")
+
+    encoding = headers.get(CONTENT_ENCODING_HEADER)
+    if encoding == ZLIB_ENCODING:
+        body = zlib.decompress(body)
+    elif encoding:
+        raise ValueError(f"Unsupported content encoding {encoding}")
+
+    content_type = headers.get(CONTENT_TYPE_HEADER, JSON_CONTENT_TYPE)
+    if content_type == JSON_CONTENT_TYPE:
+        data = orjson.loads(body)
+    elif content_type == MSGPACK_CONTENT_TYPE and msgpack is not None:
+        data = msgpack.unpackb(body)
+    else:
+        raise ValueError(f"Unsupported content type {content_type}")
+    return AlertMessage.from_dict(data)
@@ -1,46 +1,210 @@
-import aio_pika
-import json
+import asyncio
 import logging
-from app.utils.config import load_config
+import time
+from app.utils import metrics
+from app.utils.config import get_config
+from app.utils.logging import SAMPLED
 from app.utils.handlers import send_smtp_email, send_msteams_webhook, send_zoom_webhook
-
-# Load configuration
-config = load_config()
-valid_service_ids = {service['id'] for service in config['services']}
+from app.utils.renderers import AlertRenderer, DIGEST_RENDERERS
+from app.utils.dispatcher import Dispatcher
+from app.utils.envelope import ALERT_ID_HEADER, decode_message
+from app.utils.retry import ATTEMPT_HEADER, schedule_retry
+from app.utils.status import DELIVERED, FAILED, PARKED, HELD, get_status_store
+from app.utils.circuit import HALF_OPEN, get_circuit_breakers
 
 def validate_service(service_id):
-    return service_id in valid_service_ids
+    return service_id in get_config().services_by_id
+
+def group_deliveries(services: list) -> list:
+    """
+    Groups services into deliveries.
+
+    Every webhook service is its own delivery, while all SMTP services are
+    combined so the alert is emailed to their recipients in one transaction.
+
+    Args:
+        services (list): The service configurations to deliver to.
+
+    Returns:
+        list: A list of service lists, one per delivery.
+    """
+    smtp_services = [service for service in services if service['type'] == 'smtp']
+    deliveries = [[service] for service in services if service['type'] != 'smtp']
+    if smtp_services:
+        deliveries.append(smtp_services)
+    return deliveries
+
+async def deliver(services: list, renderer: AlertRenderer):
+    """
+    Delivers an alert to a group of services of the same type.
+
+    Args:
+        services (list): The service configurations, as grouped by `group_deliveries`.
+        renderer (AlertRenderer): The renderer for the alert, shared by all of its deliveries.
+    """
+    service = services[0]
+    if service['type'] == 'zoom':
+        await send_zoom_webhook(service['recipient'], service['authorization'], await renderer.render('zoom'))
+    elif service['type'] == 'msteams':
+        await send_msteams_webhook(service['recipient'], await renderer.render('msteams'))
+    elif service['type'] == 'smtp':
+        await send_smtp_email([service['recipient'] for service in services], await renderer.render('smtp'))
+
+async def deliver_digest(services: list, messages: list):
+    """
+    Delivers a digest of several alerts to a group of services of the same type.
+
+    Args:
+        services (list): The service configurations, as grouped by `group_deliveries`.
+        messages (list): The decoded alerts to include in the digest.
+    """
+    service = services[0]
+    payload = await DIGEST_RENDERERS[service['type']](messages)
+    if service['type'] == 'zoom':
+        await send_zoom_webhook(service['recipient'], service['authorization'], payload)
+    elif service['type'] == 'msteams':
+        await send_msteams_webhook(service['recipient'], payload)
+    elif service['type'] == 'smtp':
+        await send_smtp_email([service['recipient'] for service in services], payload)
+
+# Rate limits deliveries per destination, coalescing bursts into digests
+dispatcher = Dispatcher(deliver, deliver_digest)
+
+async def dispatch(services: list, renderer: AlertRenderer, alert_id: str = None, attempt: int = 1):
+    """
+    Dispatches an alert to a group of services, recording the delivery latency and outcome for each service.
+
+    If the alert has an id and the delivery status store is enabled, the
+    outcome is also recorded there under the alert's delivery attempt.
+    """
+    outcome = 'failure'
+    error = None
+    start = time.perf_counter()
+    metrics.deliveries_in_flight.inc()
+    try:
+        await dispatcher.dispatch(services, renderer)
+        outcome = 'success'
+    except Exception as e:
+        error = str(e) or type(e).__name__
+        raise
+    finally:
+        metrics.deliveries_in_flight.dec()
+        elapsed = time.perf_counter() - start
+        for service in services:
+            metrics.delivery_seconds.observe(elapsed, service['type'], service['id'], outcome)
+        status_store = get_status_store()
+        if status_store and alert_id:
+            status = DELIVERED if outcome == 'success' else FAILED
+            for service in services:
+                status_store.record_delivery(alert_id, service, status, attempt, elapsed, error)
+
+async def deliver_or_hold(message, services: list, renderer: AlertRenderer, alert_id: str, attempt: int):
+    """
+    Dispatches an alert to a group of services through the circuit breaker of their destination.
 
-async def on_message(message: aio_pika.IncomingMessage):
+    While the breaker is open the delivery is not attempted, and the
+    message is moved to the destination's holding queue for these services.
+    """
+    breakers = get_circuit_breakers()
+    breaker = breakers.get(services) if breakers else None
+    if breaker and not breaker.allow():
+        await breaker.hold(message.routing_key, message.body, message.headers, [service['id'] for service in services])
+        status_store = get_status_store()
+        if status_store and alert_id:
+            for service in services:
+                status_store.record_delivery(alert_id, service, HELD, attempt - 1)
+        return
+
+    probe = breaker is not None and breaker.state == HALF_OPEN
     try:
-        logging.info("Received message in %s queue", message.routing_key)
-        
-        # Decode and parse the message body
-        message_json = json.loads(message.body.decode("utf-8"))
-        
+        await dispatch(services, renderer, alert_id, attempt)
+    except Exception:
+        if breaker:
+            breaker.record_failure()
+        raise
+    else:
+        if breaker:
+            breaker.record_success()
+    finally:
+        if probe and breaker.state == HALF_OPEN:
+            # The probe was cancelled before its outcome was known, so let the next delivery probe instead
+            breaker.probing = False
+
+async def on_message(message):
+    """
+    Delivers a consumed message, either an aio-pika incoming message or a `broker.MemoryMessage`.
+    """
+    # The services still owed the alert, once the deliveries have been attempted
+    failed_service_ids = None
+    try:
+        logging.info("Received message in %s queue", message.routing_key, extra=SAMPLED)
+
+        # Decode the message body from its envelope
+        alert = decode_message(message.body, message.headers)
+
+        services_by_id = get_config().services_by_id
+        selected_services = []
         for service_id in message.headers.get('service_ids', []):
-            if validate_service(service_id):
-                selected_service = next(
-                    (service for service in config['services'] if service["id"] == service_id),
-                    None
-                )
-                
-                if not selected_service:
-                    logging.warning("Service with id %s not found", service_id)
-                    continue
-                
-                logging.info("Selected service id=%s, type=%s", selected_service['id'], selected_service['type'])
-                
-                if selected_service['type'] == 'zoom':
-                    send_zoom_webhook(selected_service['recipient'], selected_service['authorization'], message_json)
-                elif selected_service['type'] == 'msteams':
-                    send_msteams_webhook(selected_service['recipient'], message_json)
-                elif selected_service['type'] == 'smtp':
-                    send_smtp_email(selected_service['recipient'], message_json)
+            selected_service = services_by_id.get(service_id)
+            if selected_service:
+                logging.info("Selected service id=%s, type=%s", selected_service['id'], selected_service['type'], extra=SAMPLED)
+                selected_services.append(selected_service)
             else:
                 logging.warning("Invalid service id: %s", service_id)
-        
+
+        # Deliver to every destination concurrently and track each outcome
+        alert_id = message.headers.get(ALERT_ID_HEADER)
+        attempt = int(message.headers.get(ATTEMPT_HEADER, 0)) + 1
+        deliveries = group_deliveries(selected_services)
+        renderer = AlertRenderer(alert)
+        results = await asyncio.gather(
+            *(deliver_or_hold(message, services, renderer, alert_id, attempt) for services in deliveries),
+            return_exceptions=True
+        )
+
+        failed_services = []
+        errors = []
+        for services, result in zip(deliveries, results):
+            if isinstance(result, BaseException):
+                for service in services:
+                    logging.error("Delivery to service id=%s failed: %s", service['id'], result)
+                    failed_services.append(service)
+                    errors.append(f"{service['id']}: {result}")
+        failed_service_ids = [service['id'] for service in failed_services]
+
+        # Schedule a delayed retry for the failed destinations only, so
+        # services that already received the alert are not sent it again
+        if failed_services:
+            parked = await schedule_retry(
+                message.routing_key,
+                message.body,
+                message.headers,
+                failed_service_ids,
+                "; ".join(errors)
+            )
+            status_store = get_status_store()
+            if parked and status_store and alert_id:
+                for service in failed_services:
+                    status_store.record_delivery(alert_id, service, PARKED, attempt)
+
         await message.ack()
     except Exception as e:
         logging.error("An error occurred while processing the message: %s", e)
-        await message.nack(requeue=True)  # Requeue the message for further processing
+        try:
+            # Back off instead of immediately redelivering the message, only
+            # to the services that have not received it if deliveries were made
+            if failed_service_ids is None:
+                failed_service_ids = message.headers.get('service_ids', [])
+            if failed_service_ids:
+                await schedule_retry(
+                    message.routing_key,
+                    message.body,
+                    message.headers,
+                    failed_service_ids,
+                    str(e)
+                )
+            await message.ack()
+        except Exception as retry_error:
+            logging.error("Failed to schedule retry for the message: %s", retry_error)
+            metrics.requeues_total.inc(message.routing_key)
+            await message.nack(requeue=True)  # Requeue the message for further processing
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+from urllib.parse import urlsplit
+import httpx
+from app.utils.config import get_config
+
+# Shared keep-alive client and per-host concurrency limits
+http_client: httpx.AsyncClient = None
+host_semaphores: dict[str, asyncio.Semaphore] = {}
+
+def get_http_client() -> httpx.AsyncClient:
+    return http_client
+
+async def init_http_client():
+    """
+    Initializes the shared asynchronous HTTP client.
+
+    The client keeps connections alive between deliveries so webhook calls
+    do not pay a fresh TCP and TLS handshake each time. Pool size, keep-alive
+    expiry and timeouts are taken from the configuration.
+    """
+    global http_client
+    config = get_config()
+    try:
+        limits = httpx.Limits(
+            max_connections=config.get('http_max_connections', 100),
+            max_keepalive_connections=config.get('http_max_keepalive_connections', 20),
+            keepalive_expiry=config.get('http_keepalive_expiry', 30)
+        )
+        timeout = httpx.Timeout(
+            config.get('http_timeout', 10),
+            connect=config.get('http_connect_timeout', 5)
+        )
+        http_client = httpx.AsyncClient(limits=limits, timeout=timeout)
+        logging.info("HTTP client initialized successfully")
+    except Exception as e:
+        logging.error("Failed to initialize HTTP client: %s", e)
+        raise
+
+async def close_http_client():
+    """
+    Closes the shared asynchronous HTTP client and its pooled connections.
+    """
+    global http_client
+    try:
+        if http_client:
+            await http_client.aclose()
+            logging.info("HTTP client closed successfully")
+            http_client = None
+            host_semaphores.clear()
+    except Exception as e:
+        logging.error("Failed to close HTTP client: %s", e)
+        raise
+
+def get_host_semaphore(url: str) -> asyncio.Semaphore:
+    """
+    Returns the semaphore limiting concurrent requests to the host of a URL.
+    """
+    host = urlsplit(url).netloc
+    semaphore = host_semaphores.get(host)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(get_config().get('http_max_connections_per_host', 10))
+        host_semaphores[host] = semaphore
+    return semaphore
+
+async def send_request(method: str, url: str, **kwargs) -> httpx.Response:
+    """
+    Sends a request through the shared client, bounded per destination host.
+
+    Args:
+        method (str): The HTTP method to use.
+        url (str): The URL to send the request to.
+        **kwargs: Additional arguments passed to `httpx.AsyncClient.request`.
+
+    Returns:
+        httpx.Response: The response received from the server.
+    """
+    async with get_host_semaphore(url):
+        return await http_client.request(method, url, **kwargs)
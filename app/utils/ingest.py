@@ -0,0 +1,213 @@
+import asyncio
+import logging
+from collections import deque, defaultdict
+from app.utils import metrics
+from app.utils.broker import get_broker
+from app.utils.config import get_config
+from app.utils.outbox import get_outbox
+
+class BufferFull(Exception):
+    """
+    Raised when the ingest buffer has no room for another alert.
+    """
+
+class IngestBuffer:
+    """
+    A bounded in-memory buffer of accepted alerts, published in micro-batches.
+
+    Requests only encode their alert and add it to the buffer. A background
+    task publishes the buffered messages every `flush_interval` seconds, or
+    as soon as `batch_size` of them are waiting, grouped by queue so each
+    group is published over one channel and waits on its publisher confirms
+    together. Messages that fail to publish are spooled to the outbox if it
+    is enabled, otherwise they are put back and retried after
+    `retry_interval` seconds, which fills the buffer and pushes back on
+    new requests while the broker is down.
+
+    On shutdown the background task is asked to stop and publishes what is
+    left before it exits. A flush cut short by the shutdown timeout puts its
+    messages back in the buffer, so a message may be published twice but an
+    accepted alert is never silently lost.
+    """
+
+    def __init__(self, max_size: int = 10000, flush_interval: float = 0.005, batch_size: int = 200,
+                 retry_interval: float = 1):
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.retry_interval = retry_interval
+        self.messages: deque = deque()
+        self.ready = asyncio.Event()
+        self.stopping = asyncio.Event()
+        self.task: asyncio.Task = None
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def submit(self, queue_name: str, body: bytes, headers: dict) -> None:
+        """
+        Adds a message to the buffer without waiting for it to be published.
+
+        Raises:
+            BufferFull: If the buffer holds `max_size` messages.
+        """
+        if len(self.messages) >= self.max_size:
+            metrics.rate_limited_total.inc('buffer_full')
+            raise BufferFull("Ingest buffer is full")
+        self.messages.append((queue_name, body, headers))
+        if len(self.messages) >= self.batch_size:
+            self.ready.set()
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.run())
+
+    async def close(self, timeout: float = None) -> None:
+        """
+        Stops the background publisher after a last attempt to publish the
+        buffered messages, or once `timeout` seconds have passed.
+        """
+        self.stopping.set()
+        self.ready.set()
+        if self.task:
+            try:
+                await asyncio.wait_for(self.task, timeout)
+            except asyncio.TimeoutError:
+                pass
+        else:
+            try:
+                await asyncio.wait_for(self.flush_all(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        if self.messages:
+            logging.error("Ingest buffer closed with %s alerts not published", len(self.messages))
+
+    async def run(self) -> None:
+        while not self.stopping.is_set():
+            try:
+                await asyncio.wait_for(self.ready.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.ready.clear()
+            if not await self.flush_all():
+                try:
+                    await asyncio.wait_for(self.stopping.wait(), self.retry_interval)
+                except asyncio.TimeoutError:
+                    pass
+        # Publish what was accepted before the buffer was closed
+        await self.flush_all()
+
+    async def flush_all(self) -> bool:
+        """
+        Publishes the buffered messages in batches of `batch_size`.
+
+        Returns:
+            bool: False if some messages failed and were put back in the buffer.
+        """
+        while self.messages:
+            if not await self.flush():
+                return False
+        return True
+
+    async def flush(self) -> bool:
+        """
+        Publishes up to `batch_size` buffered messages, one publish batch per queue.
+
+        Returns:
+            bool: False if some messages failed and were put back in the buffer.
+        """
+        batch = [self.messages.popleft() for _ in range(min(self.batch_size, len(self.messages)))]
+        try:
+            failed = await self.publish(batch)
+        except asyncio.CancelledError:
+            # Cancelled at shutdown with the outcome unknown, so keep the whole batch
+            self.messages.extendleft(reversed(batch))
+            raise
+        if failed:
+            # Put the messages back at the front of the buffer, in their original order
+            self.messages.extendleft(batch[index] for index in reversed(failed))
+            return False
+        return True
+
+    async def publish(self, batch: list) -> list:
+        """
+        Publishes a batch of messages and spools those that fail to the outbox, if it is enabled.
+
+        Returns:
+            list: The indexes of the messages that were neither published nor spooled.
+        """
+        groups = defaultdict(list)
+        for index, (queue_name, body, headers) in enumerate(batch):
+            groups[queue_name].append(index)
+
+        outcomes = [None] * len(batch)
+        outbox = get_outbox()
+        if outbox and outbox.active:
+            # Queue behind the alerts already spooled
+            failed = list(range(len(batch)))
+        else:
+            async def publish_group(queue_name, indexes):
+                publish = get_broker().publish_batch(queue_name, [batch[index][1:] for index in indexes])
+                try:
+                    results = await (asyncio.wait_for(publish, outbox.publish_timeout) if outbox else publish)
+                except Exception as e:
+                    results = [e] * len(indexes)
+                for index, result in zip(indexes, results):
+                    outcomes[index] = result
+
+            with metrics.publish_seconds.time('ingest_batch'):
+                await asyncio.gather(*(publish_group(queue_name, indexes) for queue_name, indexes in groups.items()))
+            failed = [index for index, outcome in enumerate(outcomes) if isinstance(outcome, BaseException)]
+            if failed:
+                error = outcomes[failed[0]]
+                logging.warning("Failed to publish %s buffered alerts: %s", len(failed), str(error) or type(error).__name__)
+
+        if failed and outbox:
+            spooled = await asyncio.gather(
+                *(outbox.append(*batch[index]) for index in failed), return_exceptions=True
+            )
+            failed = [index for index, outcome in zip(failed, spooled) if isinstance(outcome, BaseException)]
+        return failed
+
+# Global variable to hold the ingest buffer, if fast-ack mode is enabled
+ingest_buffer: IngestBuffer = None
+
+def get_ingest_buffer() -> IngestBuffer:
+    """
+    Returns the ingest buffer, or None if fast-ack mode is not enabled.
+    """
+    return ingest_buffer
+
+async def init_ingest_buffer():
+    """
+    Starts the ingest buffer if the `fast_ack` section is configured.
+    """
+    global ingest_buffer
+    settings = get_config().get('fast_ack')
+    if not settings or not settings.get('enabled', True):
+        return
+    ingest_buffer = IngestBuffer(
+        max_size=settings.get('buffer_size', 10000),
+        flush_interval=settings.get('flush_interval', 0.005),
+        batch_size=settings.get('batch_size', 200),
+        retry_interval=settings.get('retry_interval', 1)
+    )
+    ingest_buffer.start()
+    logging.info("Fast-ack ingest enabled with a buffer of %s alerts", ingest_buffer.max_size)
+
+async def close_ingest_buffer():
+    """
+    Publishes what is left in the ingest buffer and stops it.
+    """
+    global ingest_buffer
+    try:
+        if ingest_buffer is not None:
+            await ingest_buffer.close(get_config().get('shutdown_timeout', 30))
+            ingest_buffer = None
+    except Exception as e:
+        logging.error("Failed to close ingest buffer: %s", e)
+        raise
+
+ingest_buffer_messages = metrics.Gauge(
+    "wuphf_ingest_buffer_messages", "Accepted alerts waiting in the ingest buffer to be published",
+    function=lambda: {(): len(ingest_buffer) if ingest_buffer is not None else 0}
+)
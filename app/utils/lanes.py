@@ -0,0 +1,61 @@
+from app.schemas.alerts import Alert, Severity
+
+# Message header carrying the priority of an alert, applied by the broker when publishing
+PRIORITY_HEADER = 'x-priority'
+
+# Message priority for each severity, capped at the queue's max_priority
+SEVERITY_PRIORITIES = {
+    Severity.critical: 3,
+    Severity.warning: 2,
+    Severity.info: 1,
+    Severity.ok: 1
+}
+
+def critical_lane_name(queue_name: str) -> str:
+    return f"{queue_name}.critical"
+
+def consumed_queues(config) -> dict:
+    """
+    Returns the settings of every queue to consume, keyed by queue name.
+
+    A queue with `critical_concurrency` also has a critical lane, consumed
+    separately with that many delivery slots reserved for critical alerts.
+    """
+    queues = dict(config.queues_by_name)
+    for queue in config.queues_by_name.values():
+        if queue.get('critical_concurrency'):
+            lane = critical_lane_name(queue['name'])
+            queues[lane] = {
+                **queue,
+                'name': lane,
+                'max_concurrency': queue['critical_concurrency'],
+                'prefetch_count': queue['critical_concurrency']
+            }
+    return queues
+
+def priority_queue_arguments(config) -> dict:
+    """
+    Returns the declaration arguments of the queues with a `max_priority`, keyed by queue name.
+    """
+    return {
+        queue['name']: {'x-max-priority': queue['max_priority']}
+        for queue in config.queues_by_name.values()
+        if queue.get('max_priority')
+    }
+
+def alert_route(alert: Alert, queue: dict) -> tuple[str, int]:
+    """
+    Returns the queue an alert is published to and its message priority.
+
+    Critical alerts go to the queue's critical lane if it has one. The
+    priority is only set on queues with a `max_priority`.
+
+    Returns:
+        tuple[str, int]: The queue name, and the priority or None.
+    """
+    if alert.severity is Severity.critical and queue.get('critical_concurrency'):
+        return critical_lane_name(queue['name']), None
+    max_priority = queue.get('max_priority')
+    if not max_priority:
+        return queue['name'], None
+    return queue['name'], min(SEVERITY_PRIORITIES.get(alert.severity, 0), max_priority)
@@ -1,34 +1,102 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import queue
+import random
 import colorlog
+from app.utils.config import get_config
+
+# Pass as `extra=SAMPLED` on high-volume lines logged for every request or message
+SAMPLED = {'sampled': True}
+
+# Background thread writing queued log records
+log_listener: logging.handlers.QueueListener = None
+
+class JSONFormatter(logging.Formatter):
+    """
+    Formats log records as compact single-line JSON objects.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, separators=(',', ':'), default=str)
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps only a fraction of the records logged with `extra=SAMPLED`.
+    Warnings and errors are always kept.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if getattr(record, 'sampled', False) and record.levelno < logging.WARNING:
+            return random.random() < self.rate
+        return True
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queues records without formatting them, so message interpolation and
+    formatting happen on the listener thread rather than the event loop.
+    """
+
+    def prepare(self, record):
+        return record
 
 def setup_logging():
     """
-    Sets up the logging with colored output using colorlog.
-    Removes all existing handlers and adds a new one to ensure
-    only the desired handler is active.
+    Sets up queue-backed logging with colored or JSON output.
+
+    Records are put on a queue by the calling thread and formatted and
+    written by a background listener thread. Removes all existing handlers
+    so only the queue handler is active. Calling this again has no effect.
     """
+    global log_listener
+    if log_listener is not None:
+        return
+
+    settings = get_config().get('logging') or {}
     logger = logging.getLogger()
-    
+
     # Remove all existing handlers
     for handler in logger.handlers[:]:
         logger.removeHandler(handler)
-        
+
     handler = logging.StreamHandler()
-    
+
     # Define a format for the log messages
-    formatter = colorlog.ColoredFormatter(
-        "%(log_color)s%(levelname)s%(log_color)s:%(reset)s     %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S",
-        log_colors={
-            'DEBUG': 'cyan',
-            'INFO': 'green',
-            'WARNING': 'yellow',
-            'ERROR': 'red',
-            'CRITICAL': 'bold_red',
-        }
-    )
-    
+    if settings.get('format') == 'json':
+        formatter = JSONFormatter()
+    else:
+        formatter = colorlog.ColoredFormatter(
+            "%(log_color)s%(levelname)s%(log_color)s:%(reset)s     %(message)s",
+            datefmt="%Y-%m-%d %H:%M:%S",
+            log_colors={
+                'DEBUG': 'cyan',
+                'INFO': 'green',
+                'WARNING': 'yellow',
+                'ERROR': 'red',
+                'CRITICAL': 'bold_red',
+            }
+        )
     handler.setFormatter(formatter)
-    logger = logging.getLogger()
-    logger.addHandler(handler)
-    logger.setLevel(logging.INFO)
+
+    queue_handler = DeferredQueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(SamplingFilter(settings.get('sample_rate', 1.0)))
+
+    log_listener = logging.handlers.QueueListener(queue_handler.queue, handler, respect_handler_level=True)
+    log_listener.start()
+    atexit.register(log_listener.stop)
+
+    logger.addHandler(queue_handler)
+    logger.setLevel(settings.get('level', 'INFO'))
@@ -0,0 +1,204 @@
+import time
+from bisect import bisect_left
+
+# Latency buckets in seconds, from sub-millisecond publishes to slow webhooks
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Every metric, in the order they are exposed
+registry: list = []
+
+def format_labels(labelnames, labels, extra: str = "") -> str:
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(labelnames, labels)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class Metric:
+    """
+    Base class for metrics exposed in the Prometheus text format.
+
+    Recording is a plain dictionary update with no locking. All recording
+    happens on the event loop thread, so updates cannot interleave.
+    """
+    type = None
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values: dict = {}
+        registry.append(self)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for labels, value in list(self.values.items()):
+            lines.append(f"{self.name}{format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), function=None):
+        """
+        Args:
+            function: Optional callable returning {labels: value}, evaluated when the metrics are rendered.
+        """
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def set(self, value: float, *labels) -> None:
+        self.values[labels] = value
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+    def render(self) -> list:
+        if self.function is not None:
+            self.values = dict(self.function())
+        return super().render()
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value: float, *labels) -> None:
+        entry = self.values.get(labels)
+        if entry is None:
+            # Per-bucket counts, then the sum and count of observations
+            entry = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            self.values[labels] = entry
+        entry[bisect_left(self.buckets, value)] += 1
+        entry[-2] += value
+        entry[-1] += 1
+
+    def time(self, *labels) -> "Timer":
+        return Timer(self, labels)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for labels, entry in list(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), entry):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labelnames, labels)} {entry[-2]}")
+            lines.append(f"{self.name}_count{format_labels(self.labelnames, labels)} {entry[-1]}")
+        return lines
+
+class Timer:
+    """
+    Context manager observing the time spent in its block.
+    """
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram: Histogram, labels: tuple):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+def render_metrics() -> str:
+    """
+    Returns every metric in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# Ingest
+alert_request_seconds = Histogram(
+    "wuphf_alert_request_seconds", "Time spent handling /alert/ requests, by stage", ("stage",)
+)
+alerts_suppressed_total = Counter(
+    "wuphf_alerts_suppressed_total", "Alerts suppressed as duplicates"
+)
+rate_limited_total = Counter(
+    "wuphf_rate_limited_total", "Requests rejected by rate limiting or load shedding", ("reason",)
+)
+
+# Broker
+publish_seconds = Histogram(
+    "wuphf_publish_seconds", "Time spent publishing messages outside /alert/ requests, by stage", ("stage",)
+)
+messages_consumed_total = Counter(
+    "wuphf_messages_consumed_total", "Messages consumed, by queue", ("queue",)
+)
+retries_total = Counter(
+    "wuphf_retries_total", "Messages scheduled for retry or parked, by queue", ("queue", "outcome")
+)
+requeues_total = Counter(
+    "wuphf_requeues_total", "Messages nacked and requeued, by queue", ("queue",)
+)
+pool_in_use = Gauge(
+    "wuphf_rabbitmq_pool_in_use", "Connections and publishing channels currently acquired from the RabbitMQ pools", ("pool",)
+)
+pool_max_size = Gauge(
+    "wuphf_rabbitmq_pool_max_size", "Maximum size of the RabbitMQ pools", ("pool",)
+)
+
+# Delivery
+delivery_seconds = Histogram(
+    "wuphf_delivery_seconds", "Delivery latency, by service and outcome", ("service_type", "service_id", "outcome")
+)
+deliveries_in_flight = Gauge(
+    "wuphf_deliveries_in_flight", "Deliveries currently in progress"
+)
+zoom_token_refreshes_total = Counter(
+    "wuphf_zoom_token_refreshes_total", "Zoom OAuth token refreshes, by outcome", ("outcome",)
+)
+zoom_jid_lookups_total = Counter(
+    "wuphf_zoom_jid_lookups_total", "Zoom JID lookups, by result", ("result",)
+)
+smtp_sessions_total = Counter(
+    "wuphf_smtp_sessions_total", "SMTP sessions used for sends, by whether they were opened or reused", ("event",)
+)
+
+# Outbox
+outbox_spooled_total = Counter(
+    "wuphf_outbox_spooled_total", "Alerts written to the outbox because they could not be published"
+)
+outbox_drained_total = Counter(
+    "wuphf_outbox_drained_total", "Spooled alerts published from the outbox"
+)
+outbox_rejected_total = Counter(
+    "wuphf_outbox_rejected_total", "Alerts rejected because the outbox was full"
+)
+
+# Delivery status
+delivery_status_dropped_total = Counter(
+    "wuphf_delivery_status_dropped_total", "Delivery status records dropped because writes fell behind or failed"
+)
+
+# Circuit breakers
+circuit_breaker_transitions_total = Counter(
+    "wuphf_circuit_breaker_transitions_total", "Circuit breaker state changes, by new state", ("state",)
+)
+deliveries_held_total = Counter(
+    "wuphf_deliveries_held_total", "Deliveries moved to a holding queue while their destination's breaker was open",
+    ("service_type",)
+)
+deliveries_replayed_total = Counter(
+    "wuphf_deliveries_replayed_total", "Held deliveries released back to their queue", ("service_type",)
+)
@@ -0,0 +1,254 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+import orjson
+from app.utils import metrics
+from app.utils.broker import get_broker
+from app.utils.config import get_config
+
+class OutboxFull(Exception):
+    """
+    Raised when the outbox has reached its size limit.
+    """
+
+class Outbox:
+    """
+    A durable on-disk spool for alerts that could not be published.
+
+    Messages are stored in a SQLite database in WAL mode. Appends are
+    grouped and committed together, so concurrent requests share one fsync,
+    and every caller waits until its message is on disk. A background task
+    publishes the stored messages in the order they were spooled once the
+    broker accepts them again, and deletes them as they are confirmed.
+    All database work runs on a single thread off the event loop.
+    """
+
+    def __init__(self, path: str, max_messages: int = 100000, max_bytes: int = 100 * 1024 * 1024,
+                 flush_interval: float = 0.005, drain_batch_size: int = 100, retry_interval: float = 5,
+                 publish_timeout: float = 5):
+        self.path = path
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.drain_batch_size = drain_batch_size
+        self.retry_interval = retry_interval
+        self.publish_timeout = publish_timeout
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="outbox")
+        self.connection: sqlite3.Connection = None
+        self.count = 0
+        self.size = 0
+        self.pending: list[tuple[tuple, asyncio.Future]] = []
+        # The batch being committed, no longer pending and not yet counted
+        self.writing: list[tuple[tuple, asyncio.Future]] = []
+        self.flush_task: asyncio.Task = None
+        self.drain_task: asyncio.Task = None
+        self.wakeup = asyncio.Event()
+
+    async def run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    def _open(self) -> tuple[int, int]:
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=FULL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, queue_name TEXT NOT NULL, "
+            "body BLOB NOT NULL, headers BLOB NOT NULL, created REAL NOT NULL)"
+        )
+        self.connection.commit()
+        return self._count()
+
+    def _count(self) -> tuple[int, int]:
+        return self.connection.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(body)), 0) FROM outbox").fetchone()
+
+    def _insert(self, rows: list) -> None:
+        self.connection.executemany(
+            "INSERT INTO outbox (queue_name, body, headers, created) VALUES (?, ?, ?, ?)", rows
+        )
+        self.connection.commit()
+
+    def _read(self, limit: int) -> list:
+        return self.connection.execute(
+            "SELECT id, queue_name, body, headers FROM outbox ORDER BY id LIMIT ?", (limit,)
+        ).fetchall()
+
+    def _delete_through(self, last_id: int) -> None:
+        self.connection.execute("DELETE FROM outbox WHERE id <= ?", (last_id,))
+        self.connection.commit()
+
+    async def open(self) -> None:
+        self.count, self.size = await self.run(self._open)
+        self.drain_task = asyncio.create_task(self.drain())
+        if self.count:
+            logging.warning("Outbox %s holds %s alerts from a previous run", self.path, self.count)
+
+    async def close(self) -> None:
+        if self.drain_task:
+            self.drain_task.cancel()
+            try:
+                await self.drain_task
+            except asyncio.CancelledError:
+                pass
+        if self.flush_task:
+            await self.flush_task
+        if self.connection:
+            await self.run(self.connection.close)
+        self.executor.shutdown()
+        if self.count:
+            logging.warning("Outbox closed with %s alerts still spooled", self.count)
+
+    @property
+    def active(self) -> bool:
+        """
+        True while the outbox holds messages, in which case new alerts are spooled behind them to keep their order.
+        """
+        return bool(self.count or self.pending or self.writing)
+
+    async def append(self, queue_name: str, body: bytes, headers: dict) -> None:
+        """
+        Stores a message and waits until it is committed to disk.
+
+        Raises:
+            OutboxFull: If the outbox is at its message or size limit.
+        """
+        if self.count + len(self.writing) + len(self.pending) >= self.max_messages or self.size + len(body) > self.max_bytes:
+            metrics.outbox_rejected_total.inc()
+            raise OutboxFull("Outbox is full")
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append(((queue_name, body, orjson.dumps(headers), time.time()), future))
+        self.size += len(body)
+        if self.flush_task is None:
+            self.flush_task = asyncio.create_task(self.flush())
+        await future
+
+    async def flush(self) -> None:
+        """
+        Commits the appended messages in one transaction after a short delay that lets more of them join it.
+        """
+        await asyncio.sleep(self.flush_interval)
+        batch, self.pending = self.pending, []
+        self.writing = batch
+        self.flush_task = None
+        try:
+            await self.run(self._insert, [row for row, _ in batch])
+        except Exception as e:
+            self.writing = []
+            logging.error("Failed to write %s alerts to the outbox: %s", len(batch), e)
+            self.size -= sum(len(row[1]) for row, _ in batch)
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        self.writing = []
+        self.count += len(batch)
+        metrics.outbox_spooled_total.inc(amount=len(batch))
+        for _, future in batch:
+            future.set_result(None)
+        self.wakeup.set()
+
+    async def drain(self) -> None:
+        """
+        Publishes the spooled messages in order, retrying while the broker or the database is unavailable.
+        """
+        while True:
+            if not self.count:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+            try:
+                drained = await self.drain_batch()
+            except Exception as e:
+                logging.error("Failed to drain the outbox, retrying in %ss: %s",
+                              self.retry_interval, str(e) or type(e).__name__)
+                drained = False
+            if not drained:
+                await asyncio.sleep(self.retry_interval)
+
+    async def drain_batch(self) -> bool:
+        """
+        Publishes the oldest spooled messages and deletes those the broker accepted.
+
+        Returns:
+            bool: False if a message failed to publish.
+        """
+        rows = await self.run(self._read, self.drain_batch_size)
+        if not rows:
+            # The outbox is empty on disk, so bring the counters back in line with it
+            count, size = await self.run(self._count)
+            logging.warning("Outbox counted %s alerts but holds %s, resynchronizing", self.count, count)
+            self.count = count
+            self.size = size + sum(len(row[1]) for row, _ in self.pending + self.writing)
+            return True
+
+        published = None
+        published_bytes = 0
+        try:
+            for row_id, queue_name, body, headers in rows:
+                await asyncio.wait_for(
+                    get_broker().publish(queue_name, body, orjson.loads(headers)), self.publish_timeout
+                )
+                published = row_id
+                published_bytes += len(body)
+        except Exception as e:
+            logging.warning("Failed to publish spooled alerts, retrying in %ss: %s",
+                            self.retry_interval, str(e) or type(e).__name__)
+
+        if published is not None:
+            await self.run(self._delete_through, published)
+            drained = sum(1 for row in rows if row[0] <= published)
+            self.count -= drained
+            self.size -= published_bytes
+            metrics.outbox_drained_total.inc(amount=drained)
+            if not self.count:
+                logging.info("Outbox drained")
+        return published == rows[-1][0]
+
+# Global variable to hold the outbox, if enabled
+outbox: Outbox = None
+
+def get_outbox() -> Outbox:
+    return outbox
+
+async def init_outbox():
+    """
+    Opens the outbox if the `outbox` section is configured.
+    """
+    global outbox
+    settings = get_config().get('outbox')
+    if not settings or not settings.get('enabled', True):
+        return
+    outbox = Outbox(
+        settings.get('path', 'outbox.db'),
+        max_messages=settings.get('max_messages', 100000),
+        max_bytes=settings.get('max_bytes', 100 * 1024 * 1024),
+        flush_interval=settings.get('flush_interval', 0.005),
+        drain_batch_size=settings.get('drain_batch_size', 100),
+        retry_interval=settings.get('retry_interval', 5),
+        publish_timeout=settings.get('publish_timeout', 5)
+    )
+    await outbox.open()
+    logging.info("Outbox opened at %s", outbox.path)
+
+async def close_outbox():
+    """
+    Stops draining the outbox and closes it. Spooled alerts are kept for the next run.
+    """
+    global outbox
+    try:
+        if outbox:
+            await outbox.close()
+            outbox = None
+    except Exception as e:
+        logging.error("Failed to close outbox: %s", e)
+        raise
+
+outbox_messages = metrics.Gauge(
+    "wuphf_outbox_messages", "Alerts spooled in the outbox",
+    function=lambda: {(): outbox.count if outbox else 0}
+)
+outbox_bytes = metrics.Gauge(
+    "wuphf_outbox_bytes", "Size of the alert bodies spooled in the outbox",
+    function=lambda: {(): outbox.size if outbox else 0}
+)
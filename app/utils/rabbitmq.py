@@ -2,65 +2,364 @@ import aio_pika
 from aio_pika.pool import Pool
 import asyncio
 import logging
-from app.utils.gateway import on_message
-from app.utils.config import load_config
+import time
+from contextlib import asynccontextmanager
+from app.utils import metrics
+from app.utils.broker import Broker, queue_arguments
+from app.utils.config import get_config
+from app.utils.lanes import PRIORITY_HEADER, consumed_queues
 
-# load the configuration
-config = load_config()
+# Global variables to hold the connection and publishing channel pools
+connection_pool: Pool[aio_pika.RobustConnection] = None
+channel_pool: Pool[aio_pika.RobustChannel] = None
+
+# Names of queues already declared on the broker by this process
+declared_queues: set[str] = set()
+
+# Last known message count and when it was read, keyed by queue name
+queue_depths: dict[str, tuple[int, float]] = {}
+queue_depth_refreshes: dict[str, asyncio.Task] = {}
 
 def get_connection_pool() -> Pool[aio_pika.Connection]:
     return connection_pool
 
+def get_channel_pool() -> Pool[aio_pika.Channel]:
+    return channel_pool
+
 async def init_connection_pool():
     """
-    Initializes the RabbitMQ connection pool.
+    Initializes the RabbitMQ connection and channel pools.
     
-    This function sets up a connection pool with a maximum size of 20 connections
-    using the provided configuration settings.
+    A small number of robust connections feed a larger pool of long-lived
+    publishing channels, so publishing does not open and close a channel
+    per alert. Publisher confirms are enabled on the channels unless turned
+    off in the configuration.
     """
-    global connection_pool
+    global connection_pool, channel_pool
+    config = get_config()
     try:
         loop = asyncio.get_event_loop()
         connection_pool = Pool(
             lambda: aio_pika.connect_robust(config['rabbitmq_conn'], loop=loop),
-            max_size=20
+            max_size=config.get('rabbitmq_connection_pool_size', 2)
+        )
+
+        async def get_channel() -> aio_pika.Channel:
+            async with acquire_connection() as connection:
+                return await connection.channel(
+                    publisher_confirms=config.get('rabbitmq_publisher_confirms', True)
+                )
+
+        channel_pool = Pool(
+            get_channel,
+            max_size=config.get('rabbitmq_channel_pool_size', 10)
         )
+        metrics.pool_max_size.set(config.get('rabbitmq_connection_pool_size', 2), 'connection')
+        metrics.pool_max_size.set(config.get('rabbitmq_channel_pool_size', 10), 'channel')
+        metrics.pool_in_use.set(0, 'connection')
+        metrics.pool_in_use.set(0, 'channel')
         logging.info("Connection pool initialized successfully")
     except Exception as e:
-        logging.error(f"Failed to initialize connection pool: {e}")
+        logging.error("Failed to initialize connection pool: %s", e)
         raise
     
 async def close_connection_pool():
     """
-    Closes the RabbitMQ connection pool.
+    Closes the RabbitMQ channel and connection pools.
     
-    This function ensures that all connections in the pool are properly closed
+    This function ensures that all channels and connections in the pools are properly closed
     and logs the completion of this operation.
     """
-    global connection_pool
+    global connection_pool, channel_pool
     try:
+        await stop_consumers(get_config().get('shutdown_timeout', 30))
+        if channel_pool:
+            await channel_pool.close()
+            channel_pool = None
         if connection_pool:
             await connection_pool.close()
             logging.info("Connection pool closed successfully")
             connection_pool = None
+        declared_queues.clear()
     except Exception as e:
-        logging.error(f"Failed to close connection pool: {e}")
+        logging.error("Failed to close connection pool: %s", e)
         raise
         
-async def listen_queues():
+async def declare_queue(channel: aio_pika.Channel, queue_name: str) -> None:
     """
-    Declares and sets up consumers for the specified queues.
-    
-    This function acquires a connection from the pool, declares each queue,
-    and attaches a message consumer to it using the `on_message` callback.
+    Declares a queue on the broker unless this process already declared it.
+
+    Any arguments registered for the queue in `queue_arguments` are used,
+    so every declaration of a queue is consistent.
+
+    Args:
+        channel (aio_pika.Channel): The channel used to declare the queue.
+        queue_name (str): The name of the queue to declare.
+    """
+    if queue_name in declared_queues:
+        return
+    await channel.declare_queue(queue_name, arguments=queue_arguments.get(queue_name))
+    declared_queues.add(queue_name)
+
+class QueueConsumer:
+    """
+    Consumes a single queue on its own channel.
+
+    The channel prefetch bounds how many unacknowledged messages the broker
+    pushes to this consumer, and a semaphore bounds how many of them are
+    delivered concurrently, so one busy queue cannot starve the others.
+    """
+
+    def __init__(self, queue: dict):
+        self.name = queue['name']
+        self.max_concurrency = queue.get('max_concurrency') or get_config().get('default_max_concurrency', 10)
+        self.prefetch_count = queue.get('prefetch_count') or self.max_concurrency
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.in_flight: set[asyncio.Task] = set()
+        self.channel: aio_pika.Channel = None
+        self.queue: aio_pika.Queue = None
+        self.consumer_tag: str = None
+        self.callback = None
+
+    async def start(self, connection: aio_pika.Connection) -> None:
+        """
+        Opens the channel, applies the prefetch limit and starts consuming.
+        """
+        # Imported here as the gateway and retry modules publish through this module
+        from app.utils.gateway import on_message
+        from app.utils.retry import declare_retry_queues
+        self.callback = on_message
+
+        self.channel = await connection.channel()
+        await self.channel.set_qos(prefetch_count=self.prefetch_count)
+        self.queue = await self.channel.declare_queue(self.name, arguments=queue_arguments.get(self.name))
+        declared_queues.add(self.name)
+        await declare_retry_queues(self.channel, self.name)
+        self.consumer_tag = await self.queue.consume(self.handle_message)
+        logging.info(
+            "Consuming queue %s with prefetch=%s, max_concurrency=%s",
+            self.name, self.prefetch_count, self.max_concurrency
+        )
+
+    async def handle_message(self, message: aio_pika.IncomingMessage) -> None:
+        metrics.messages_consumed_total.inc(self.name)
+        task = asyncio.current_task()
+        self.in_flight.add(task)
+        try:
+            async with self.semaphore:
+                await self.callback(message)
+        finally:
+            self.in_flight.discard(task)
+
+    async def stop(self, timeout: float = None) -> None:
+        """
+        Cancels the consumer, waits for in-flight deliveries and closes the channel.
+
+        Args:
+            timeout (float): The maximum number of seconds to wait for in-flight deliveries.
+        """
+        if self.queue and self.consumer_tag:
+            await self.queue.cancel(self.consumer_tag)
+        if self.in_flight:
+            await asyncio.wait(list(self.in_flight), timeout=timeout)
+        if self.channel and not self.channel.is_closed:
+            await self.channel.close()
+        logging.info("Stopped consuming queue %s", self.name)
+
+# Running consumers keyed by queue name
+consumers: dict[str, QueueConsumer] = {}
+
+def build_message(body: bytes, headers: dict = None) -> aio_pika.Message:
+    """
+    Builds an AMQP message, with the priority given by its `lanes.PRIORITY_HEADER` header.
+    """
+    headers = headers or {}
+    return aio_pika.Message(body=body, headers=headers, priority=headers.get(PRIORITY_HEADER))
+
+@asynccontextmanager
+async def acquire_connection():
+    """
+    Acquires a connection from the pool, counting it as in use until it is released.
+    """
+    async with connection_pool.acquire() as connection:
+        metrics.pool_in_use.inc('connection')
+        try:
+            yield connection
+        finally:
+            metrics.pool_in_use.dec('connection')
+
+@asynccontextmanager
+async def acquire_channel(timings: metrics.Histogram = metrics.publish_seconds):
+    """
+    Acquires a publishing channel from the pool, recording the time spent
+    waiting for it under the `channel_acquire` stage of `timings`.
+    """
+    start = time.perf_counter()
+    async with channel_pool.acquire() as channel:
+        timings.observe(time.perf_counter() - start, 'channel_acquire')
+        metrics.pool_in_use.inc('channel')
+        try:
+            yield channel
+        finally:
+            metrics.pool_in_use.dec('channel')
+
+async def publish_message(queue_name: str, body: bytes, headers: dict = None,
+                          timings: metrics.Histogram = metrics.publish_seconds) -> None:
+    """
+    Publishes a message to a queue using a pooled channel.
+
+    Args:
+        queue_name (str): The name of the queue to publish to.
+        body (bytes): The message body.
+        headers (dict): The AMQP headers to attach to the message.
+        timings (metrics.Histogram): The histogram recording the channel acquire and publish stages.
+
+    Raises:
+        aio_pika.exceptions.DeliveryError: If publisher confirms are enabled and the broker rejects the message.
+    """
+    async with acquire_channel(timings) as channel:
+        with timings.time('publish'):
+            await declare_queue(channel, queue_name)
+            await channel.default_exchange.publish(
+                build_message(body, headers),
+                routing_key=queue_name
+            )
+
+async def publish_messages(queue_name: str, messages: list) -> list:
+    """
+    Publishes several messages to the same queue over one pooled channel.
+
+    All messages are published before waiting on any of the publisher
+    confirms, so the whole group costs roughly one broker round trip.
+
+    Args:
+        queue_name (str): The name of the queue to publish to.
+        messages (list): (body, headers) tuples.
+
+    Returns:
+        list: One entry per message, either None if it was published or the exception raised.
+    """
+    async with acquire_channel() as channel:
+        await declare_queue(channel, queue_name)
+        return await asyncio.gather(
+            *(
+                channel.default_exchange.publish(
+                    build_message(body, headers),
+                    routing_key=queue_name
+                )
+                for body, headers in messages
+            ),
+            return_exceptions=True
+        )
+
+async def get_message(queue_name: str) -> aio_pika.IncomingMessage:
+    """
+    Takes the next message from a queue with a basic get, or returns None if the queue is empty.
+
+    The message is settled on the pooled channel it was taken with, and is
+    returned to the queue if that channel closes before it is acknowledged.
     """
+    async with acquire_channel() as channel:
+        await declare_queue(channel, queue_name)
+        queue = await channel.get_queue(queue_name, ensure=False)
+        return await queue.get(no_ack=False, fail=False)
+
+async def refresh_queue_depth(queue_name: str) -> None:
     try:
-        async with connection_pool.acquire() as connection:
-            channel = await connection.channel()
-            for queue in config['queues']:
-                declared_queue = await channel.declare_queue(queue['name'])
-                await declared_queue.consume(on_message)
-            logging.info("Queues and consumers set up successfully")
+        async with acquire_channel() as channel:
+            # aio-pika answers declare_queue from the channel's cache once a queue
+            # is declared, so the passive declare is sent on the underlying channel
+            underlay = await channel.get_underlay_channel()
+            result = await underlay.queue_declare(queue_name, passive=True)
+            queue_depths[queue_name] = (result.message_count, time.monotonic())
     except Exception as e:
-        logging.error(f"Failed to set up queues and consumers: {e}")
-        raise
\ No newline at end of file
+        logging.warning("Failed to read depth of queue %s: %s", queue_name, e)
+    finally:
+        queue_depth_refreshes.pop(queue_name, None)
+
+def get_queue_depth(queue_name: str, max_age: float = 1) -> int:
+    """
+    Returns the last known number of messages waiting in a queue.
+
+    The depth is read with a passive declare. A stale value is refreshed in
+    the background, so callers never wait on the broker.
+
+    Args:
+        queue_name (str): The name of the queue.
+        max_age (float): The number of seconds after which the cached depth is refreshed.
+
+    Returns:
+        int: The cached message count, or 0 if it has not been read yet.
+    """
+    depth, updated = queue_depths.get(queue_name, (0, 0))
+    if (time.monotonic() - updated > max_age and queue_name in declared_queues
+            and queue_name not in queue_depth_refreshes):
+        queue_depth_refreshes[queue_name] = asyncio.create_task(refresh_queue_depth(queue_name))
+    return depth
+
+async def reconcile_consumers() -> tuple[list, list]:
+    """
+    Starts and stops consumers so they match the configured queues.
+
+    Consumers are only started for queues that are not consumed yet and only
+    stopped for queues no longer configured. All other consumers keep running.
+
+    Returns:
+        tuple[list, list]: The names of the queues added and removed.
+    """
+    configured = consumed_queues(get_config())
+    added = [name for name in configured if name not in consumers]
+    removed = [name for name in consumers if name not in configured]
+
+    for name in removed:
+        await consumers.pop(name).stop(get_config().get('shutdown_timeout', 30))
+
+    if added:
+        async with acquire_connection() as connection:
+            for name in added:
+                consumer = QueueConsumer(configured[name])
+                await consumer.start(connection)
+                consumers[name] = consumer
+
+    return added, removed
+
+async def stop_consumers(timeout: float = None):
+    """
+    Stops all running consumers, letting in-flight deliveries finish.
+
+    Args:
+        timeout (float): The maximum number of seconds to wait for in-flight deliveries.
+    """
+    await asyncio.gather(*(consumer.stop(timeout) for consumer in consumers.values()))
+    consumers.clear()
+
+class RabbitMQBroker(Broker):
+    """
+    The broker backed by RabbitMQ through the pools and consumers in this module.
+    """
+    consumers = consumers
+
+    async def start(self) -> None:
+        await init_connection_pool()
+
+    async def close(self) -> None:
+        await close_connection_pool()
+
+    async def publish(self, queue_name: str, body: bytes, headers: dict = None,
+                      timings: metrics.Histogram = metrics.publish_seconds) -> None:
+        await publish_message(queue_name, body, headers, timings)
+
+    async def publish_batch(self, queue_name: str, messages: list) -> list:
+        return await publish_messages(queue_name, messages)
+
+    async def get(self, queue_name: str) -> aio_pika.IncomingMessage:
+        return await get_message(queue_name)
+
+    def get_queue_depth(self, queue_name: str, max_age: float = 1) -> int:
+        return get_queue_depth(queue_name, max_age)
+
+    async def reconcile_consumers(self) -> tuple[list, list]:
+        return await reconcile_consumers()
+
+    async def stop_consumers(self, timeout: float = None) -> None:
+        await stop_consumers(timeout)
@@ -0,0 +1,156 @@
+import math
+import time
+from fastapi import Depends, HTTPException
+from app.utils import metrics
+from app.utils.auth import validate_api_key
+from app.utils.config import get_config
+from app.utils.broker import get_broker
+
+class TokenBucket:
+    """
+    A token bucket refilled continuously at `rate` tokens per second, up to `capacity`.
+    """
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def configure(self, rate: float, capacity: float) -> None:
+        """
+        Changes the rate and capacity, keeping the tokens left up to the new capacity.
+        """
+        self.refill()
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = min(self.tokens, capacity)
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def consume(self, tokens: float = 1) -> float:
+        """
+        Takes tokens from the bucket if enough are available.
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise the number of seconds until they will be available.
+        """
+        self.refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return 0
+        return (tokens - self.tokens) / self.rate if self.rate > 0 else math.inf
+
+    def take(self, tokens: int) -> int:
+        """
+        Takes as many whole tokens as are available, up to `tokens`.
+
+        Returns:
+            int: The number of tokens taken.
+        """
+        self.refill()
+        taken = min(tokens, int(self.tokens))
+        self.tokens -= taken
+        return taken
+
+# Token buckets keyed by API key digest, with the limits they were built for
+api_key_buckets: dict[str, tuple[dict, TokenBucket]] = {}
+
+def get_api_key_bucket(api_key_digest: str) -> TokenBucket:
+    """
+    Returns the token bucket for an API key, or None if it is not rate limited.
+
+    If the key's limits change on a configuration reload, the bucket keeps
+    its tokens and only takes the new rate and burst.
+    """
+    limits = get_config().api_keys.get(api_key_digest)
+    if not limits:
+        return None
+    rate = limits['rate']
+    entry = api_key_buckets.get(api_key_digest)
+    if entry is None:
+        entry = (limits, TokenBucket(rate, limits.get('burst', rate)))
+        api_key_buckets[api_key_digest] = entry
+    elif entry[0] != limits:
+        entry[1].configure(rate, limits.get('burst', rate))
+        entry = (limits, entry[1])
+        api_key_buckets[api_key_digest] = entry
+    return entry[1]
+
+def enforce_rate_limit(api_key: str = Depends(validate_api_key)):
+    """
+    Validates the API key and applies its request rate limit.
+
+    Returns:
+        str: The digest identifying the API key.
+
+    Raises:
+        HTTPException: 429 with a Retry-After header if the key is over its limit.
+    """
+    bucket = get_api_key_bucket(api_key)
+    if bucket is not None:
+        wait = bucket.consume()
+        if wait:
+            metrics.rate_limited_total.inc('rate_limit')
+            raise rate_limit_exceeded(wait)
+    return api_key
+
+def enforce_batch_rate_limit(api_key: str, size: int) -> int:
+    """
+    Charges an API key one token for each alert in a batch.
+
+    Returns:
+        int: The number of alerts at the start of the batch covered by the
+        key's tokens. The rest of the batch is over the limit.
+
+    Raises:
+        HTTPException: 429 with a Retry-After header if no alert of the batch is covered.
+    """
+    bucket = get_api_key_bucket(api_key)
+    if bucket is None:
+        return size
+    allowed = bucket.take(size)
+    if allowed < size:
+        metrics.rate_limited_total.inc('rate_limit', amount=size - allowed)
+    if not allowed and size:
+        raise rate_limit_exceeded(bucket.consume())
+    return allowed
+
+def rate_limit_exceeded(wait: float) -> HTTPException:
+    retry_after = 60 if wait == math.inf else max(1, math.ceil(wait))
+    return HTTPException(
+        status_code=429,
+        detail="Rate limit exceeded",
+        headers={"Retry-After": str(retry_after)}
+    )
+
+def is_queue_overloaded(queue_name: str) -> bool:
+    """
+    Returns True if load shedding is enabled and the queue is over its depth threshold.
+    """
+    load_shedding = get_config().get('load_shedding')
+    if not load_shedding or not load_shedding.get('max_queue_depth'):
+        return False
+    depth = get_broker().get_queue_depth(queue_name, load_shedding.get('depth_cache_seconds', 1))
+    if depth > load_shedding['max_queue_depth']:
+        metrics.rate_limited_total.inc('load_shedding')
+        return True
+    return False
+
+def check_queue_load(queue_name: str) -> None:
+    """
+    Rejects new alerts for a queue whose backlog is over the load shedding threshold.
+
+    Raises:
+        HTTPException: 503 with a Retry-After header if the queue is overloaded.
+    """
+    if is_queue_overloaded(queue_name):
+        raise HTTPException(
+            status_code=503,
+            detail="Queue is overloaded",
+            headers={"Retry-After": str(get_config()['load_shedding'].get('retry_after', 5))}
+        )
@@ -0,0 +1,80 @@
+import asyncio
+import logging
+import signal
+import watchfiles
+from app.utils.config import CONFIG_FILE, Config, get_config, load_config, set_config
+from app.utils.broker import get_broker, register_queue_priorities
+
+# Serializes reloads triggered by the endpoint, SIGHUP and the file watcher
+reload_lock = asyncio.Lock()
+
+# Background task watching the configuration file
+watch_task: asyncio.Task = None
+
+async def reload_config() -> dict:
+    """
+    Reloads config.yaml and applies it without restarting the process.
+
+    The new file is validated before anything changes. The routing data is
+    then swapped in one step and, in processes that consume queues,
+    consumers are reconciled, starting only queues that were added and
+    stopping only queues that were removed.
+
+    Returns:
+        dict: The names of the queues added and removed.
+
+    Raises:
+        Exception: If the file cannot be read or fails validation, in which case the current configuration is kept.
+    """
+    async with reload_lock:
+        new_config = Config(load_config(CONFIG_FILE))
+        set_config(new_config)
+        register_queue_priorities()
+        broker = get_broker()
+        added, removed = await broker.reconcile_consumers() if broker.consuming else ([], [])
+        logging.info("Configuration reloaded, queues added: %s, queues removed: %s", added, removed)
+        return {'queues_added': added, 'queues_removed': removed}
+
+async def reload_config_safely() -> None:
+    try:
+        await reload_config()
+    except Exception as e:
+        logging.error("Failed to reload configuration, keeping current configuration: %s", e)
+
+async def watch_config() -> None:
+    async for _ in watchfiles.awatch(CONFIG_FILE):
+        logging.info("Configuration file %s changed", CONFIG_FILE)
+        await reload_config_safely()
+
+def start_config_reloading() -> None:
+    """
+    Reloads the configuration on SIGHUP and, if `config_watch` is enabled,
+    whenever config.yaml changes on disk.
+    """
+    global watch_task
+    loop = asyncio.get_running_loop()
+    try:
+        loop.add_signal_handler(signal.SIGHUP, lambda: asyncio.ensure_future(reload_config_safely()))
+    except (NotImplementedError, AttributeError):
+        logging.warning("SIGHUP configuration reload is not supported on this platform")
+    except (RuntimeError, ValueError) as e:
+        # Signal handlers can only be set from the main thread, e.g. not under an embedded server
+        logging.warning("SIGHUP configuration reload is not available: %s", e)
+
+    if get_config().get('config_watch', False):
+        watch_task = asyncio.create_task(watch_config())
+        logging.info("Watching %s for changes", CONFIG_FILE)
+
+async def stop_config_reloading() -> None:
+    global watch_task
+    try:
+        asyncio.get_running_loop().remove_signal_handler(signal.SIGHUP)
+    except (NotImplementedError, AttributeError, RuntimeError, ValueError):
+        pass
+    if watch_task:
+        watch_task.cancel()
+        try:
+            await watch_task
+        except asyncio.CancelledError:
+            pass
+        watch_task = None
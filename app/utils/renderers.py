@@ -0,0 +1,294 @@
+import asyncio
+import mistune
+import orjson
+from app.schemas.alerts import Severity
+from app.utils.envelope import AlertMessage
+from app.utils.zoom import get_zoom_jids
+
+# Markdown renderer shared by every email, configured once
+markdown = mistune.create_markdown(escape=False, plugins=["strikethrough", "footnotes", "table", "speedup"])
+
+# Severity to colour and container style maps
+ZOOM_SIDEBAR_COLORS = {
+    Severity.critical: "#FF0000",
+    Severity.warning: "#FFFF00",
+    Severity.ok: "#00FF00"
+}
+ZOOM_DEFAULT_SIDEBAR_COLOR = "#0000FF"
+
+MSTEAMS_STYLES = {
+    Severity.critical: "attention",
+    Severity.warning: "warning",
+    Severity.ok: "good"
+}
+MSTEAMS_DEFAULT_STYLE = "accent"
+
+# Static parts of the payload templates, shared by every rendered payload
+ZOOM_HEAD_STYLE = {"bold": "true"}
+
+MSTEAMS_CARD_SCHEMA = "http://adaptivecards.io/schemas/adaptive-card.json"
+MSTEAMS_CARD_TYPE = "application/vnd.microsoft.card.adaptive"
+
+def render_zoom_payload(message, user_string=None):
+    """
+    Builds the Zoom incoming webhook payload for an alert.
+
+    :param message: The alert, as an `AlertMessage`.
+    :param user_string: The mentions of the tagged users, if any.
+    """
+    body = [
+        {
+            "type": "message",
+            "is_markdown_support": "true",
+            "text": message.message
+        }
+    ]
+
+    # Conditionally add the tagged users
+    if user_string:
+        body.insert(0, {
+            "type": "message",
+            "is_markdown_support": "true",
+            "text": user_string
+        })
+
+    # Conditionally add the "View More Details" entry
+    if message.url:
+        body.append({
+            "type": "message",
+            "text": "View More Details",
+            "link": message.url
+        })
+
+    return {
+        "content": {
+            "settings": {
+                "default_sidebar_color": ZOOM_SIDEBAR_COLORS.get(message.severity, ZOOM_DEFAULT_SIDEBAR_COLOR)
+            },
+            "head": {
+                "text": message.title,
+                "style": ZOOM_HEAD_STYLE
+            },
+            "body": body
+        }
+    }
+
+async def render_zoom(message):
+    """
+    Renders an alert for Zoom, resolving the tagged users' JIDs concurrently.
+
+    Returns:
+        bytes: The serialized webhook payload.
+    """
+    user_string = None
+    if message.tagged_users:
+        jids = await get_zoom_jids([user['id'] for user in message.tagged_users])
+        user_string = " ".join(
+            f"<!{jid}|{user['name']}>" for jid, user in zip(jids, message.tagged_users)
+        )
+    return orjson.dumps(render_zoom_payload(message, user_string))
+
+def render_msteams_card(message):
+    """
+    Builds the Adaptive Card content for an alert.
+
+    :param message: The alert, as an `AlertMessage`.
+    """
+    body = [
+        {
+            "type": "Container",
+            "items": [
+                {
+                    "type": "TextBlock",
+                    "text": message.title,
+                    "size": "Large",
+                    "weight": "Bolder"
+                }
+            ],
+            "style": MSTEAMS_STYLES.get(message.severity, MSTEAMS_DEFAULT_STYLE),
+            "bleed": True
+        },
+        {
+            "type": "TextBlock",
+            "text": message.message,
+            "wrap": True
+        }
+    ]
+    content = {
+        "$schema": MSTEAMS_CARD_SCHEMA,
+        "type": "AdaptiveCard",
+        "version": "1.4",
+        "body": body
+    }
+
+    # Conditionally add the actions key if url is not empty
+    if message.url:
+        content['actions'] = [
+            {
+                "type": "Action.OpenUrl",
+                "title": "View More Details",
+                "url": message.url
+            }
+        ]
+
+    # Conditionally add the mentions and the tagged users to the body
+    if message.tagged_users:
+        content['msteams'] = {
+            "entities": [
+                {
+                    "type": "mention",
+                    "text": f"<at>{user['name']}</at>",
+                    "mentioned": {
+                        "id": user['id'],
+                        "name": user['name']
+                    }
+                }
+                for user in message.tagged_users
+            ]
+        }
+        body.insert(1, {
+            "type": "TextBlock",
+            "text": ' '.join(f"<at>{user['name']}</at>" for user in message.tagged_users),
+            "wrap": True
+        })
+
+    return content
+
+async def render_msteams(message):
+    """
+    Renders an alert as an MS Teams Adaptive Card message.
+
+    Returns:
+        bytes: The serialized webhook payload.
+    """
+    payload = {
+        "type": "message",
+        "attachments": [
+            {
+                "contentType": MSTEAMS_CARD_TYPE,
+                "contentUrl": "null",
+                "content": render_msteams_card(message)
+            }
+        ]
+    }
+    return orjson.dumps(payload)
+
+async def render_smtp(message):
+    """
+    Renders an alert as an email.
+
+    Returns:
+        tuple: The subject and the HTML body.
+    """
+    if message.severity:
+        subject = f"{message.severity.value.upper()} - {message.title}"
+    else:
+        subject = message.title
+    return subject, markdown(message.message)
+
+# Severities from most to least urgent, used to pick a digest's severity
+SEVERITY_ORDER = (Severity.critical, Severity.warning, Severity.info, Severity.ok)
+
+def digest_severity(messages):
+    """
+    Returns the most urgent severity among several alerts, or None if none is set.
+    """
+    severities = {message.severity for message in messages}
+    return next((severity for severity in SEVERITY_ORDER if severity in severities), None)
+
+def digest_title(messages):
+    return f"{len(messages)} alerts"
+
+def digest_tagged_users(messages):
+    """
+    Returns the tagged users of several alerts, without repeats.
+    """
+    users = {}
+    for message in messages:
+        for user in message.tagged_users or []:
+            users.setdefault(user['id'], user)
+    return list(users.values())
+
+def digest_line(message):
+    severity = message.severity
+    prefix = f"[{severity.value.upper()}] " if severity else ""
+    line = f"**{prefix}{message.title}**\n\n{message.message}"
+    if message.url:
+        line += f"\n\n[View More Details]({message.url})"
+    return line
+
+async def render_zoom_digest(messages):
+    """
+    Renders several alerts as one Zoom message listing all of them.
+
+    Returns:
+        bytes: The serialized webhook payload.
+    """
+    digest = AlertMessage(
+        title=digest_title(messages),
+        message="\n\n".join(digest_line(message) for message in messages),
+        severity=digest_severity(messages),
+        tagged_users=digest_tagged_users(messages)
+    )
+    return await render_zoom(digest)
+
+async def render_msteams_digest(messages):
+    """
+    Renders several alerts as one Adaptive Card listing all of them.
+
+    Returns:
+        bytes: The serialized webhook payload.
+    """
+    digest = AlertMessage(
+        title=digest_title(messages),
+        message="\n\n".join(digest_line(message) for message in messages),
+        severity=digest_severity(messages),
+        tagged_users=digest_tagged_users(messages)
+    )
+    return await render_msteams(digest)
+
+async def render_smtp_digest(messages):
+    """
+    Renders several alerts as one email listing all of them.
+
+    Returns:
+        tuple: The subject and the HTML body.
+    """
+    severity = digest_severity(messages)
+    title = digest_title(messages)
+    subject = f"{severity.value.upper()} - {title}" if severity else title
+    body = "<hr>".join(markdown(digest_line(message)) for message in messages)
+    return subject, body
+
+# Renderer for each service type
+RENDERERS = {
+    'zoom': render_zoom,
+    'msteams': render_msteams,
+    'smtp': render_smtp
+}
+
+# Digest renderer for each service type
+DIGEST_RENDERERS = {
+    'zoom': render_zoom_digest,
+    'msteams': render_msteams_digest,
+    'smtp': render_smtp_digest
+}
+
+class AlertRenderer:
+    """
+    Renders one alert at most once per service type.
+
+    Every destination of the same type reuses the same rendered payload,
+    including destinations delivered to concurrently.
+    """
+
+    def __init__(self, message):
+        self.message = message
+        self.rendered = {}
+
+    async def render(self, service_type):
+        rendering = self.rendered.get(service_type)
+        if rendering is None:
+            rendering = asyncio.ensure_future(RENDERERS[service_type](self.message))
+            self.rendered[service_type] = rendering
+        return await asyncio.shield(rendering)
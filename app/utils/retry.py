@@ -0,0 +1,112 @@
+import logging
+import aio_pika
+from app.utils import metrics
+from app.utils.broker import get_broker, queue_arguments
+from app.utils.config import get_config
+from app.utils.rabbitmq import declare_queue
+
+# Default backoff tiers in seconds, and number of delivery attempts before parking
+DEFAULT_RETRY_DELAYS = [5, 30, 300]
+DEFAULT_MAX_ATTEMPTS = 5
+
+# Message headers used to track retries
+ATTEMPT_HEADER = 'x-retry-attempt'
+ERROR_HEADER = 'x-retry-last-error'
+
+# Headers set by the broker when dead-lettering, which must not be republished
+BROKER_HEADERS = ('x-death', 'x-first-death-exchange', 'x-first-death-queue', 'x-first-death-reason',
+                  'x-last-death-exchange', 'x-last-death-queue', 'x-last-death-reason')
+
+def retry_settings() -> tuple[list, int]:
+    """
+    Returns the retry delays and maximum attempts from the current configuration, so a reload applies them.
+    """
+    settings = get_config().get('retry') or {}
+    return settings.get('delays', DEFAULT_RETRY_DELAYS), settings.get('max_attempts', DEFAULT_MAX_ATTEMPTS)
+
+def retry_queue_name(queue_name: str, delay) -> str:
+    return f"{queue_name}.retry.{delay}s"
+
+def parking_queue_name(queue_name: str) -> str:
+    return f"{queue_name}.parked"
+
+def register_retry_queues(queue_name: str) -> list:
+    """
+    Registers the declaration arguments of the retry tiers for a consumed queue.
+
+    Each retry tier is a queue with no consumers whose messages expire after
+    the tier's delay and are dead-lettered back onto the original queue
+    through the default exchange.
+
+    Returns:
+        list: The names of the retry tiers and the parking queue.
+    """
+    names = []
+    delays, _ = retry_settings()
+    for delay in delays:
+        name = retry_queue_name(queue_name, delay)
+        queue_arguments[name] = {
+            'x-message-ttl': int(delay * 1000),
+            'x-dead-letter-exchange': '',
+            'x-dead-letter-routing-key': queue_name
+        }
+        names.append(name)
+    names.append(parking_queue_name(queue_name))
+    return names
+
+async def declare_retry_queues(channel: aio_pika.Channel, queue_name: str) -> None:
+    """
+    Declares the retry tiers and parking queue for a consumed queue on RabbitMQ.
+
+    Args:
+        channel (aio_pika.Channel): The channel used to declare the queues.
+        queue_name (str): The name of the consumed queue.
+    """
+    for name in register_retry_queues(queue_name):
+        await declare_queue(channel, name)
+
+async def schedule_retry(queue_name: str, body: bytes, headers: dict, service_ids: list, error: str = None) -> bool:
+    """
+    Schedules another delivery attempt of a message for the given services.
+
+    The attempt count is tracked in the message headers. The message is
+    published to the backoff tier for its attempt, or to the parking queue
+    once the maximum number of attempts is reached.
+
+    Args:
+        queue_name (str): The name of the queue the message was consumed from.
+        body (bytes): The message body.
+        headers (dict): The headers of the consumed message.
+        service_ids (list): The services the message still has to be delivered to.
+        error (str): A description of the last delivery error.
+
+    Returns:
+        bool: True if the message was parked rather than scheduled for retry.
+    """
+    delays, max_attempts = retry_settings()
+    headers = {key: value for key, value in (headers or {}).items() if key not in BROKER_HEADERS}
+    attempt = int(headers.get(ATTEMPT_HEADER, 0)) + 1
+    headers[ATTEMPT_HEADER] = attempt
+    headers['service_ids'] = service_ids
+    if error:
+        headers[ERROR_HEADER] = error[:256]
+
+    if attempt >= max_attempts:
+        target = parking_queue_name(queue_name)
+        metrics.retries_total.inc(queue_name, 'parked')
+        logging.warning(
+            "Parking message from %s after %s attempts for service ids %s", queue_name, attempt, service_ids
+        )
+    else:
+        delay = delays[min(attempt, len(delays)) - 1]
+        target = retry_queue_name(queue_name, delay)
+        if target not in queue_arguments:
+            # The delays changed on a reload since the queue's tiers were declared
+            register_retry_queues(queue_name)
+        metrics.retries_total.inc(queue_name, 'retried')
+        logging.info(
+            "Retrying message from %s in %ss (attempt %s) for service ids %s", queue_name, delay, attempt, service_ids
+        )
+
+    await get_broker().publish(target, body, headers)
+    return attempt >= max_attempts
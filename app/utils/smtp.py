@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import time
+import aiosmtplib
+from email.message import Message
+from app.utils import metrics
+from app.utils.config import get_config
+
+class SMTPPool:
+    """
+    A small pool of authenticated, reusable SMTP sessions.
+
+    Sessions are opened lazily, returned to the pool after each send and
+    reopened when they have been idle longer than the server is likely to
+    keep them, or when the server has dropped the connection.
+    """
+
+    def __init__(self, hostname: str, port: int, size: int = 2, idle_timeout: float = 60,
+                 use_tls: bool = False, start_tls: bool = False, username: str = None,
+                 password: str = None, timeout: float = 30):
+        self.hostname = hostname
+        self.port = port
+        self.idle_timeout = idle_timeout
+        self.use_tls = use_tls
+        self.start_tls = start_tls
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.semaphore = asyncio.Semaphore(size)
+        self.idle: list[tuple[aiosmtplib.SMTP, float]] = []
+
+    async def connect(self) -> aiosmtplib.SMTP:
+        client = aiosmtplib.SMTP(
+            hostname=self.hostname,
+            port=self.port,
+            use_tls=self.use_tls,
+            start_tls=self.start_tls,
+            username=self.username,
+            password=self.password,
+            timeout=self.timeout
+        )
+        await client.connect()
+        metrics.smtp_sessions_total.inc('opened')
+        logging.info("Opened SMTP session to %s:%s", self.hostname, self.port)
+        return client
+
+    async def discard(self, client: aiosmtplib.SMTP) -> None:
+        try:
+            if client.is_connected:
+                await client.quit()
+        except aiosmtplib.SMTPException:
+            client.close()
+
+    async def checkout(self) -> aiosmtplib.SMTP:
+        """
+        Returns an idle session that is still usable, or a new one.
+        """
+        while self.idle:
+            client, last_used = self.idle.pop()
+            if client.is_connected and time.monotonic() - last_used < self.idle_timeout:
+                metrics.smtp_sessions_total.inc('reused')
+                return client
+            await self.discard(client)
+        return await self.connect()
+
+    async def send(self, message: Message, sender: str, recipients: list) -> None:
+        """
+        Sends a message to one or more recipients in a single SMTP transaction.
+
+        A send that fails because the server closed an idle session is
+        retried once on a fresh session.
+
+        Args:
+            message (Message): The message to send.
+            sender (str): The envelope sender address.
+            recipients (list): The envelope recipient addresses.
+        """
+        async with self.semaphore:
+            for attempt in (1, 2):
+                client = await self.checkout()
+                try:
+                    await client.send_message(message, sender=sender, recipients=recipients)
+                except aiosmtplib.SMTPServerDisconnected:
+                    await self.discard(client)
+                    if attempt == 2:
+                        raise
+                    continue
+                except Exception:
+                    await self.discard(client)
+                    raise
+                self.idle.append((client, time.monotonic()))
+                return
+
+    async def close(self) -> None:
+        while self.idle:
+            client, _ = self.idle.pop()
+            await self.discard(client)
+
+# Global variable to hold the SMTP session pool
+smtp_pool: SMTPPool = None
+
+def get_smtp_pool() -> SMTPPool:
+    return smtp_pool
+
+async def init_smtp_pool():
+    """
+    Initializes the SMTP session pool from the configuration, if an `smtp_server` is configured.
+    """
+    global smtp_pool
+    config = get_config()
+    if not config.get('smtp_server'):
+        logging.info("No smtp_server configured, email delivery is disabled")
+        return
+    smtp_pool = SMTPPool(
+        config['smtp_server'],
+        config.get('smtp_port') or 25,
+        size=config.get('smtp_pool_size', 2),
+        idle_timeout=config.get('smtp_idle_timeout', 60),
+        use_tls=config.get('smtp_use_tls', False),
+        start_tls=config.get('smtp_start_tls', False),
+        username=config.get('smtp_username'),
+        password=config.get('smtp_password'),
+        timeout=config.get('smtp_timeout', 30)
+    )
+    logging.info("SMTP pool initialized successfully")
+
+async def close_smtp_pool():
+    """
+    Closes all idle sessions in the SMTP session pool.
+    """
+    global smtp_pool
+    try:
+        if smtp_pool:
+            await smtp_pool.close()
+            logging.info("SMTP pool closed successfully")
+            smtp_pool = None
+    except Exception as e:
+        logging.error("Failed to close SMTP pool: %s", e)
+        raise
@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app.utils import metrics
+from app.utils.config import get_config
+
+# Delivery statuses recorded for each service
+DELIVERED = 'delivered'
+FAILED = 'failed'
+PARKED = 'parked'
+HELD = 'held'
+
+class DeliveryStatusStore:
+    """
+    Records alerts and the outcome of their delivery to each service in SQLite.
+
+    Recording only appends to an in-memory list. A background task writes
+    the recorded rows in one transaction every `flush_interval` seconds, so
+    the store stays off the delivery path. If writes fall behind, rows
+    beyond `max_pending` are dropped rather than holding up deliveries.
+    Alerts older than `retention_seconds`, and the oldest alerts beyond
+    `max_alerts`, are purged together with their deliveries.
+
+    The database can be shared by the API and worker processes on one host.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 1, max_pending: int = 10000,
+                 retention_seconds: float = 7 * 24 * 3600, max_alerts: int = 1000000,
+                 purge_interval: float = 300):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.retention_seconds = retention_seconds
+        self.max_alerts = max_alerts
+        self.purge_interval = purge_interval
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="delivery-status")
+        self.connection: sqlite3.Connection = None
+        self.alerts: list[tuple] = []
+        self.deliveries: list[tuple] = []
+        self.flush_lock = asyncio.Lock()
+        self.task: asyncio.Task = None
+
+    async def run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    def _open(self) -> None:
+        self.connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(
+            "CREATE TABLE IF NOT EXISTS alerts ("
+            "id TEXT PRIMARY KEY, queue_id INTEGER, queue_name TEXT, title TEXT, severity TEXT, "
+            "received REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS alerts_received ON alerts (received);"
+            "CREATE TABLE IF NOT EXISTS deliveries ("
+            "alert_id TEXT NOT NULL, service_id INTEGER NOT NULL, service_type TEXT, status TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL, latency REAL, last_error TEXT, updated REAL NOT NULL, "
+            "PRIMARY KEY (alert_id, service_id));"
+        )
+        self.connection.commit()
+
+    def _write(self, alerts: list, deliveries: list) -> None:
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO alerts (id, queue_id, queue_name, title, severity, received) "
+            "VALUES (?, ?, ?, ?, ?, ?)", alerts
+        )
+        self.connection.executemany(
+            "INSERT INTO deliveries (alert_id, service_id, service_type, status, attempts, latency, last_error, updated) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (alert_id, service_id) DO UPDATE SET "
+            "status = excluded.status, attempts = MAX(attempts, excluded.attempts), "
+            "latency = COALESCE(excluded.latency, latency), last_error = COALESCE(excluded.last_error, last_error), "
+            "updated = excluded.updated", deliveries
+        )
+        self.connection.commit()
+
+    def _purge(self) -> int:
+        cutoff = time.time() - self.retention_seconds
+        purged = self.connection.execute("DELETE FROM alerts WHERE received < ?", (cutoff,)).rowcount
+        purged += self.connection.execute(
+            "DELETE FROM alerts WHERE id IN (SELECT id FROM alerts ORDER BY received DESC LIMIT -1 OFFSET ?)",
+            (self.max_alerts,)
+        ).rowcount
+        # Deliveries can be written by a worker before their alert by the API,
+        # so only those orphaned for a whole purge interval are removed
+        self.connection.execute(
+            "DELETE FROM deliveries WHERE updated < ? AND alert_id NOT IN (SELECT id FROM alerts)",
+            (time.time() - self.purge_interval,)
+        )
+        self.connection.commit()
+        return purged
+
+    def _get(self, alert_id: str) -> dict:
+        alert = self.connection.execute("SELECT * FROM alerts WHERE id = ?", (alert_id,)).fetchone()
+        if alert is None:
+            return None
+        deliveries = self.connection.execute(
+            "SELECT service_id, service_type, status, attempts, latency, last_error, updated "
+            "FROM deliveries WHERE alert_id = ? ORDER BY service_id", (alert_id,)
+        ).fetchall()
+        return {**dict(alert), 'deliveries': [dict(delivery) for delivery in deliveries]}
+
+    async def open(self) -> None:
+        await self.run(self._open)
+        self.task = asyncio.create_task(self.write_periodically())
+
+    async def close(self) -> None:
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+        await self.run(self.connection.close)
+        self.executor.shutdown()
+
+    def pending(self) -> int:
+        return len(self.alerts) + len(self.deliveries)
+
+    def record_alert(self, alert_id: str, queue_id: int, queue_name: str, title: str, severity: str) -> None:
+        """
+        Records an alert accepted at ingest.
+        """
+        if self.pending() >= self.max_pending:
+            metrics.delivery_status_dropped_total.inc()
+            return
+        self.alerts.append((alert_id, queue_id, queue_name, title, severity, time.time()))
+
+    def record_delivery(self, alert_id: str, service: dict, status: str, attempt: int,
+                        latency: float = None, error: str = None) -> None:
+        """
+        Records the outcome of a delivery attempt of an alert to a service.
+        """
+        if self.pending() >= self.max_pending:
+            metrics.delivery_status_dropped_total.inc()
+            return
+        self.deliveries.append((
+            alert_id, service['id'], service['type'], status, attempt, latency,
+            error[:1024] if error else None, time.time()
+        ))
+
+    async def flush(self) -> None:
+        async with self.flush_lock:
+            if not self.pending():
+                return
+            alerts, self.alerts = self.alerts, []
+            deliveries, self.deliveries = self.deliveries, []
+            try:
+                await self.run(self._write, alerts, deliveries)
+            except Exception as e:
+                logging.error("Failed to write %s delivery status records: %s", len(alerts) + len(deliveries), e)
+                metrics.delivery_status_dropped_total.inc(amount=len(alerts) + len(deliveries))
+
+    async def write_periodically(self) -> None:
+        next_purge = 0
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            if time.monotonic() >= next_purge:
+                next_purge = time.monotonic() + self.purge_interval
+                try:
+                    purged = await self.run(self._purge)
+                    if purged:
+                        logging.info("Purged delivery status of %s alerts", purged)
+                except Exception as e:
+                    logging.error("Failed to purge delivery status: %s", e)
+
+    async def get(self, alert_id: str) -> dict:
+        """
+        Returns an alert and the status of its deliveries, or None if it is not recorded.
+        """
+        await self.flush()
+        return await self.run(self._get, alert_id)
+
+# Global variable to hold the delivery status store, if enabled
+status_store: DeliveryStatusStore = None
+
+def get_status_store() -> DeliveryStatusStore:
+    """
+    Returns the delivery status store, or None if delivery status tracking is not enabled.
+    """
+    return status_store
+
+async def init_status_store():
+    """
+    Opens the delivery status store if the `delivery_status` section is configured.
+    """
+    global status_store
+    settings = get_config().get('delivery_status')
+    if not settings or not settings.get('enabled', True):
+        return
+    status_store = DeliveryStatusStore(
+        settings.get('path', 'delivery_status.db'),
+        flush_interval=settings.get('flush_interval', 1),
+        max_pending=settings.get('max_pending', 10000),
+        retention_seconds=settings.get('retention_seconds', 7 * 24 * 3600),
+        max_alerts=settings.get('max_alerts', 1000000),
+        purge_interval=settings.get('purge_interval', 300)
+    )
+    await status_store.open()
+    logging.info("Delivery status recorded in %s", status_store.path)
+
+async def close_status_store():
+    """
+    Writes the remaining records and closes the delivery status store.
+    """
+    global status_store
+    try:
+        if status_store:
+            await status_store.close()
+            status_store = None
+    except Exception as e:
+        logging.error("Failed to close delivery status store: %s", e)
+        raise
@@ -1,37 +1,79 @@
+import asyncio
 import base64
-import requests
+import httpx
+import logging
 import time
-from app.utils.config import load_config
+from app.utils import metrics
+from app.utils.cache import TTLCache, MISSING
+from app.utils.config import get_config
+from app.utils.http import send_request
 
-config = load_config()
+config = get_config()
 
-# Access configuration variables
-ZOOM_ACCOUNT_ID = config['zoom_account_id']
-ZOOM_CLIENT_ID = config['zoom_client_id']
-ZOOM_CLIENT_SECRET = config['zoom_client_secret']
 ZOOM_OAUTH_ENDPOINT = "https://zoom.us/oauth/token"
 
 # Initialize cached token and expiration time variables
 cached_zoom_token = None
 zoom_token_expiration = None
 
-def get_zoom_token():
+# Ensures only one delivery refreshes the token at a time
+zoom_token_lock = asyncio.Lock()
+
+# Cache of email address to Zoom JID, including lookups that found no user.
+# Its size and TTL are fixed when the module is loaded, so changing them needs a restart.
+zoom_jid_cache = TTLCache(
+    maxsize=config.get('zoom_jid_cache_size', 10000),
+    ttl=config.get('zoom_jid_cache_ttl', 3600)
+)
+
+# Lookups currently in progress, keyed by email address
+zoom_jid_lookups: dict[str, asyncio.Task] = {}
+
+def zoom_token_is_fresh(margin: float = 0) -> bool:
+    return bool(cached_zoom_token and zoom_token_expiration and zoom_token_expiration - margin > time.time())
+
+def cached_zoom_token_result() -> dict:
+    return {
+        'access_token': cached_zoom_token,
+        'expires_in': zoom_token_expiration - time.time(),
+        'header_config': {
+            'Authorization': f'Bearer {cached_zoom_token}',
+            'Content-Type': 'application/json'
+        },
+        'error': None
+    }
+
+async def get_zoom_token():
+    """
+    Returns a Zoom access token, refreshing it shortly before it expires.
+
+    Concurrent callers share a single refresh, and the current token keeps
+    being used if a refresh fails while it is still valid.
+    """
+    # Renew the token this many seconds before it expires
+    margin = get_config().get('zoom_token_refresh_margin', 300)
+    if zoom_token_is_fresh(margin):
+        return cached_zoom_token_result()
+
+    async with zoom_token_lock:
+        # Another delivery may have refreshed the token while we waited
+        if zoom_token_is_fresh(margin):
+            return cached_zoom_token_result()
+
+        result = await refresh_zoom_token()
+        if result['error'] and zoom_token_is_fresh():
+            logging.warning("Failed to refresh Zoom token, using current token: %s", result['error'])
+            return cached_zoom_token_result()
+        return result
+
+async def refresh_zoom_token():
     global cached_zoom_token, zoom_token_expiration
 
-    #  Check if the token is cached and not expired
-    if cached_zoom_token and zoom_token_expiration and zoom_token_expiration > time.time():
-        return {
-            'access_token': cached_zoom_token,
-            'expires_in': zoom_token_expiration - time.time(),
-            'header_config': {
-                'Authorization': f'Bearer {cached_zoom_token}',
-                'Content-Type': 'application/json'
-            },
-            'error': None
-        }
+    # Credentials are read on each refresh, so a reload applies them
+    config = get_config()
     try:
         # Create the authorization header
-        auth_string = f"{ZOOM_CLIENT_ID}:{ZOOM_CLIENT_SECRET}"
+        auth_string = f"{config.get('zoom_client_id')}:{config.get('zoom_client_secret')}"
         encoded_auth = base64.b64encode(auth_string.encode()).decode()
 
         headers = {
@@ -41,10 +83,10 @@ def get_zoom_token():
         # Prepare the data for the POST request
         data = {
             'grant_type': 'account_credentials',
-            'account_id': ZOOM_ACCOUNT_ID
+            'account_id': config.get('zoom_account_id')
         }
         # Make the POST request
-        response = requests.post(ZOOM_OAUTH_ENDPOINT, headers=headers, data=data)
+        response = await send_request("POST", ZOOM_OAUTH_ENDPOINT, headers=headers, data=data)
         response.raise_for_status()  # Raises an HTTPError for bad responses
 
         # Parse the JSON response
@@ -52,6 +94,8 @@ def get_zoom_token():
         access_token = result.get('access_token')
         expires_in = result.get('expires_in')
 
+        metrics.zoom_token_refreshes_total.inc('success')
+
         # Update the cached token and expiration
         cached_zoom_token = access_token
         zoom_token_expiration = time.time() + expires_in
@@ -66,8 +110,70 @@ def get_zoom_token():
             'expires_in': expires_in,
             'header_config': header_config, 
             'error': None}
-    except requests.RequestException as error:
+    except httpx.HTTPError as error:
+        metrics.zoom_token_refreshes_total.inc('failure')
         return {
             'access_token': None, 
             'expires_in': None, 
             'error': str(error)}
+
+async def lookup_zoom_jid(email):
+    # get a zoom token
+    zoom_token = await get_zoom_token()
+    if zoom_token['error']:
+        logging.error("Unable to look up Zoom user %s: %s", email, zoom_token['error'])
+        metrics.zoom_jid_lookups_total.inc('error')
+        return None
+
+    url = f"https://api.zoom.us/v2/users/{email}"
+    # Make the API request
+    try:
+        response = await send_request("GET", url, headers=zoom_token['header_config'])
+    except httpx.HTTPError as error:
+        logging.error("Unable to look up Zoom user %s: %s", email, error)
+        metrics.zoom_jid_lookups_total.inc('error')
+        return None
+
+    if response.status_code == 200:
+        # Extract the JID from the user data
+        jid = response.json().get('jid')
+        zoom_jid_cache.set(email, jid)
+        metrics.zoom_jid_lookups_total.inc('found')
+        return jid
+
+    if response.status_code == 404:
+        # Remember users that do not exist for a shorter time
+        zoom_jid_cache.set(email, None, get_config().get('zoom_jid_cache_miss_ttl', 300))
+        metrics.zoom_jid_lookups_total.inc('not_found')
+    else:
+        metrics.zoom_jid_lookups_total.inc('error')
+    logging.error("Error looking up Zoom user %s: %s - %s", email, response.status_code, response.text)
+    return None
+
+async def get_zoom_jid(email):
+    """
+    Returns the Zoom JID for an email address, or None if it cannot be found.
+
+    Results are cached, and concurrent lookups of the same address share a
+    single API request.
+    """
+    jid = zoom_jid_cache.get(email)
+    if jid is not MISSING:
+        metrics.zoom_jid_lookups_total.inc('cached')
+        return jid
+
+    lookup = zoom_jid_lookups.get(email)
+    if lookup is None:
+        lookup = asyncio.ensure_future(lookup_zoom_jid(email))
+        zoom_jid_lookups[email] = lookup
+        lookup.add_done_callback(lambda _: zoom_jid_lookups.pop(email, None))
+    return await asyncio.shield(lookup)
+
+async def get_zoom_jids(emails):
+    """
+    Resolves several email addresses to Zoom JIDs concurrently.
+
+    Returns:
+        list: The JIDs in the same order as the email addresses, with None for any not found.
+    """
+    return await asyncio.gather(*(get_zoom_jid(email) for email in emails))
@@ -0,0 +1,199 @@
+"""
+Standalone delivery worker.
+
+Consumes the configured queues and delivers alerts without serving the
+API, so ingestion and delivery can be scaled separately. Run with:
+
+    python -m app.worker --processes 4
+
+SIGTERM or SIGINT stops consuming and lets in-flight deliveries finish,
+up to `shutdown_timeout` seconds. SIGHUP reloads the configuration.
+If `worker_metrics_port` is set, worker process N serves its metrics at
+GET /metrics on that port plus N.
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import time
+from app.utils.logging import setup_logging
+from app.utils.metrics import render_metrics
+from app.utils.config import get_config
+from app.utils.broker import init_broker, close_broker, listen_queues
+from app.utils.http import init_http_client, close_http_client
+from app.utils.smtp import init_smtp_pool, close_smtp_pool
+from app.utils.status import init_status_store, close_status_store
+from app.utils.circuit import resume_held_deliveries, close_circuit_breakers
+from app.utils.reload import start_config_reloading, stop_config_reloading
+
+# Seconds to wait before restarting a worker process that exited unexpectedly
+RESTART_DELAY = 5
+
+# Seconds a metrics scrape may take to send its request
+METRICS_REQUEST_TIMEOUT = 5
+
+async def handle_metrics_request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """
+    Answers one HTTP request with the worker's metrics, or 404 for any other path.
+    """
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), METRICS_REQUEST_TIMEOUT)
+        # The request headers are not needed
+        while await asyncio.wait_for(reader.readline(), METRICS_REQUEST_TIMEOUT) not in (b"\r\n", b"\n", b""):
+            pass
+        method, target = (request_line.split() + [b"", b""])[:2]
+        if method == b"GET" and target.split(b"?")[0] == b"/metrics":
+            status, body = "200 OK", render_metrics().encode("utf-8")
+        else:
+            status, body = "404 Not Found", b"Not Found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("ascii") + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+async def start_metrics_server(index: int) -> asyncio.AbstractServer:
+    """
+    Serves this worker's metrics if `worker_metrics_port` is set, on that port plus the worker's index.
+
+    Returns:
+        asyncio.AbstractServer: The server, or None if worker metrics are not enabled.
+    """
+    config = get_config()
+    port = config.get('worker_metrics_port')
+    if not port:
+        return None
+    host = config.get('worker_metrics_host', '0.0.0.0')
+    server = await asyncio.start_server(handle_metrics_request, host, port + index)
+    logging.info("Serving worker metrics at http://%s:%s/metrics", host, port + index)
+    return server
+
+async def run_worker(index: int = 0) -> None:
+    """
+    Consumes and delivers alerts until SIGTERM or SIGINT is received.
+
+    Args:
+        index (int): The worker's position among the supervised processes, which offsets its metrics port.
+    """
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stopping.set)
+
+    metrics_server = None
+    try:
+        metrics_server = await start_metrics_server(index)
+        await init_status_store()
+        await init_broker()
+        await init_http_client()
+        await init_smtp_pool()
+        await listen_queues()
+        resume_held_deliveries()
+        start_config_reloading()
+        logging.info("Worker started and consuming queues")
+    except Exception as e:
+        logging.error("Failed to start worker: %s", e)
+        raise
+
+    await stopping.wait()
+    logging.info("Worker stopping, draining in-flight deliveries")
+
+    try:
+        await stop_config_reloading()
+        await close_circuit_breakers()
+        await close_broker()
+        await close_http_client()
+        await close_smtp_pool()
+        await close_status_store()
+        if metrics_server:
+            metrics_server.close()
+            await metrics_server.wait_closed()
+        logging.info("Worker shut down successfully")
+    except Exception as e:
+        logging.error("Failed to shut down worker: %s", e)
+        raise
+
+def worker_process(index: int) -> None:
+    setup_logging()
+    asyncio.run(run_worker(index))
+
+def supervise(processes: int) -> int:
+    """
+    Runs several worker processes, restarting any that exit unexpectedly.
+
+    SIGTERM and SIGINT are forwarded to the workers, which drain before
+    exiting, and SIGHUP is forwarded so each worker reloads its configuration.
+
+    Returns:
+        int: The exit code for the supervisor.
+    """
+    context = multiprocessing.get_context("spawn")
+    workers: list[multiprocessing.Process] = []
+    stopping = False
+
+    def start_worker(index: int) -> multiprocessing.Process:
+        # A restarted worker keeps its index, so it serves metrics on the same port
+        process = context.Process(target=worker_process, args=(index,), name=f"wuphf-worker-{index}")
+        process.start()
+        logging.info("Started worker process %s", process.pid)
+        return process
+
+    def forward(signum, frame):
+        nonlocal stopping
+        if signum != signal.SIGHUP:
+            stopping = True
+        for process in workers:
+            if process.is_alive():
+                os.kill(process.pid, signum)
+
+    for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(signum, forward)
+
+    workers.extend(start_worker(index) for index in range(processes))
+
+    while True:
+        for index, process in enumerate(workers):
+            if process.is_alive() or stopping:
+                continue
+            logging.error(
+                "Worker process %s exited with code %s, restarting in %ss",
+                process.pid, process.exitcode, RESTART_DELAY
+            )
+            time.sleep(RESTART_DELAY)
+            if not stopping:
+                workers[index] = start_worker(index)
+        if stopping and not any(process.is_alive() for process in workers):
+            break
+        time.sleep(0.5)
+
+    failed = [process for process in workers if process.exitcode not in (0, -signal.SIGTERM, -signal.SIGINT)]
+    logging.info("All worker processes stopped")
+    return 1 if failed else 0
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Consume queues and deliver alerts without serving the API.")
+    parser.add_argument(
+        "--processes", type=int, default=1,
+        help="number of worker processes to run, each with its own broker connections"
+    )
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    if get_config().get('broker', 'rabbitmq') == 'memory':
+        logging.error("The memory broker cannot be shared with the API, run the worker with RabbitMQ")
+        return 1
+
+    if args.processes <= 1:
+        asyncio.run(run_worker())
+        return 0
+    return supervise(args.processes)
+
+if __name__ == "__main__":
+    sys.exit(main())
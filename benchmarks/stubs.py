@@ -0,0 +1,135 @@
+import asyncio
+import random
+import re
+import time
+
+# Alert titles sent by the benchmark carry this token so deliveries can be matched to requests
+TOKEN_PATTERN = re.compile(rb"bench-(\d+)")
+
+class DeliveryRecorder:
+    """
+    Records when each benchmark alert first reached a destination, by service type.
+    """
+
+    def __init__(self):
+        self.received: dict[str, dict[int, float]] = {}
+
+    def record(self, service_type: str, data: bytes) -> None:
+        now = time.perf_counter()
+        deliveries = self.received.setdefault(service_type, {})
+        for match in TOKEN_PATTERN.finditer(data):
+            deliveries.setdefault(int(match.group(1)), now)
+
+    def count(self) -> int:
+        return sum(len(deliveries) for deliveries in self.received.values())
+
+class FakeWebhookServer:
+    """
+    A minimal keep-alive HTTP server standing in for Zoom and MS Teams webhooks.
+
+    Every POST is answered after `latency` seconds, with a 500 for a random
+    `error_rate` fraction of requests. Successful requests are recorded under
+    the first path segment, e.g. /zoom or /msteams.
+    """
+
+    def __init__(self, recorder: DeliveryRecorder, latency: float = 0, error_rate: float = 0,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.recorder = recorder
+        self.latency = latency
+        self.error_rate = error_rate
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self.errors = 0
+        self.server: asyncio.Server = None
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                _, path, _ = request_line.decode("latin-1").split(" ", 2)
+
+                content_length = 0
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    if name.strip().lower() == "content-length":
+                        content_length = int(value)
+                body = await reader.readexactly(content_length) if content_length else b""
+
+                self.requests += 1
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                if random.random() < self.error_rate:
+                    self.errors += 1
+                    writer.write(b"HTTP/1.1 500 Internal Server Error\r\nContent-Length: 0\r\n\r\n")
+                else:
+                    self.recorder.record(path.strip("/").split("/")[0], body)
+                    writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+class FakeSMTPSink:
+    """
+    A minimal SMTP server accepting every message and recording it as an smtp delivery.
+    """
+
+    def __init__(self, recorder: DeliveryRecorder, host: str = "127.0.0.1", port: int = 0):
+        self.recorder = recorder
+        self.host = host
+        self.port = port
+        self.messages = 0
+        self.server: asyncio.Server = None
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            writer.write(b"220 benchmark sink\r\n")
+            await writer.drain()
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line[:4].upper()
+                if command in (b"EHLO", b"HELO"):
+                    writer.write(b"250 benchmark sink\r\n")
+                elif command == b"DATA":
+                    writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                    await writer.drain()
+                    data = await reader.readuntil(b"\r\n.\r\n")
+                    self.messages += 1
+                    self.recorder.record("smtp", data)
+                    writer.write(b"250 OK\r\n")
+                elif command == b"QUIT":
+                    writer.write(b"221 Bye\r\n")
+                    await writer.drain()
+                    break
+                else:
+                    writer.write(b"250 OK\r\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
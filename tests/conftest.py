@@ -0,0 +1,65 @@
+import asyncio
+import inspect
+import pytest
+from app.utils import broker as broker_module
+from app.utils.broker import MemoryBroker
+from app.utils.config import Config, set_config
+
+SETTINGS = {
+    'title': 'Wuphf',
+    'description': 'Tests',
+    'api_keys': ['test-key'],
+    'broker': 'memory',
+    'services': [
+        {'id': 1, 'name': 'webhook', 'description': 'A webhook', 'type': 'webhook', 'recipient': 'http://127.0.0.1:9/hook'},
+    ],
+    'queues': [
+        {'id': 1, 'name': 'alerts', 'description': 'Alerts', 'service_ids': [1]},
+    ],
+}
+
+# Some modules read the configuration when they are imported, before any fixture runs
+set_config(Config(SETTINGS))
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_pyfunc_call(pyfuncitem):
+    """
+    Runs `async def` tests in a fresh event loop.
+    """
+    if inspect.iscoroutinefunction(pyfuncitem.obj):
+        arguments = {name: pyfuncitem.funcargs[name] for name in pyfuncitem._fixtureinfo.argnames}
+        asyncio.run(pyfuncitem.obj(**arguments))
+        return True
+    return None
+
+async def poll(condition, timeout: float = 2) -> None:
+    async def check():
+        while not condition():
+            await asyncio.sleep(0.01)
+    await asyncio.wait_for(check(), timeout)
+
+@pytest.fixture
+def wait_until():
+    """
+    Returns a coroutine function that waits up to `timeout` seconds for `condition()` to be true.
+    """
+    return poll
+
+@pytest.fixture
+def config():
+    """
+    Installs the test configuration, with any extra settings given to the returned function.
+    """
+    def configure(**settings):
+        set_config(Config({**SETTINGS, **settings}))
+    configure()
+    yield configure
+
+@pytest.fixture
+def broker(config):
+    """
+    Installs a memory broker as the application's broker.
+    """
+    broker_module.broker = MemoryBroker(publish_timeout=1)
+    yield broker_module.broker
+    broker_module.broker = None
@@ -0,0 +1,27 @@
+import asyncio
+import pytest
+from app.utils.broker import Broker, MemoryBroker
+
+def test_incomplete_broker_cannot_be_created():
+    class PublishOnlyBroker(Broker):
+        async def publish(self, queue_name, body, headers=None, timings=None):
+            pass
+
+    with pytest.raises(TypeError):
+        PublishOnlyBroker()
+
+def test_memory_broker_implements_the_interface():
+    assert isinstance(MemoryBroker(), Broker)
+
+async def test_requeue_past_the_queue_bound_keeps_the_message():
+    broker = MemoryBroker(max_queue_size=1, publish_timeout=0.05)
+    await broker.publish('alerts', b'first')
+    consumed = await broker.get('alerts')
+    await broker.publish('alerts', b'second')
+    with pytest.raises(asyncio.TimeoutError):
+        await broker.publish('alerts', b'third')
+
+    await consumed.nack(requeue=True)
+    assert broker.get_queue_depth('alerts') == 2
+    assert (await broker.get('alerts')).body == b'first'
+    assert (await broker.get('alerts')).body == b'second'
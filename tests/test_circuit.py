@@ -0,0 +1,82 @@
+import asyncio
+import time
+import pytest
+from app.utils import circuit, gateway
+from app.utils.circuit import CLOSED, HALF_OPEN, OPEN, HELD_FROM_HEADER, get_circuit_breakers
+from app.utils.config import get_config
+
+SETTINGS = {'failure_threshold': 2, 'open_seconds': 0.05, 'replay_rate': 1000}
+
+@pytest.fixture
+def breakers(config, broker):
+    config(circuit_breaker=SETTINGS)
+    circuit.circuit_breakers = None
+    yield get_circuit_breakers()
+    circuit.circuit_breakers = None
+
+async def test_breaker_opens_probes_and_replays_held_deliveries(breakers, broker, wait_until):
+    services = [get_config().services_by_id[1]]
+    breaker = breakers.get(services)
+    try:
+        breaker.record_failure()
+        assert breaker.state == CLOSED
+        breaker.record_failure()
+        assert breaker.state == OPEN
+        assert not breaker.allow()
+
+        for number in range(3):
+            await breaker.hold('alerts', f'alert {number}'.encode(), {'x-attempt': 1}, [1])
+        assert broker.get_queue_depth(breaker.holding_queue) == 3
+
+        # Once open_seconds have passed, the oldest held message is sent back as the probe
+        await wait_until(lambda: broker.get_queue_depth('alerts') == 1)
+        probe = await broker.get('alerts')
+        assert probe.body == b'alert 0'
+        assert probe.headers['service_ids'] == [1]
+        assert HELD_FROM_HEADER not in probe.headers
+        assert breaker.allow()
+        assert breaker.state == HALF_OPEN
+        assert not breaker.allow()
+
+        # A successful probe closes the breaker and replays the rest in order
+        breaker.record_success()
+        assert breaker.state == CLOSED
+        await wait_until(lambda: broker.get_queue_depth('alerts') == 2)
+        assert [(await broker.get('alerts')).body for _ in range(2)] == [b'alert 1', b'alert 2']
+        assert broker.get_queue_depth(breaker.holding_queue) == 0
+    finally:
+        await breakers.close()
+
+async def test_failed_probe_reopens_the_breaker(breakers):
+    breaker = breakers.get([get_config().services_by_id[1]])
+    try:
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.opened_at = time.monotonic() - SETTINGS['open_seconds']
+        assert breaker.allow()
+        assert breaker.state == HALF_OPEN
+        breaker.record_failure()
+        assert breaker.state == OPEN
+        assert not breaker.allow()
+    finally:
+        await breakers.close()
+
+async def test_cancelled_probe_lets_the_next_delivery_probe(breakers, monkeypatch, wait_until):
+    async def stalled_dispatch(*args):
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(gateway, 'dispatch', stalled_dispatch)
+    services = [get_config().services_by_id[1]]
+    breaker = breakers.get(services)
+    try:
+        breaker.state = OPEN
+        breaker.opened_at = time.monotonic() - SETTINGS['open_seconds']
+        delivery = asyncio.create_task(gateway.deliver_or_hold(None, services, None, 'alert-id', 1))
+        await wait_until(lambda: breaker.probing)
+        delivery.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await delivery
+        assert breaker.state == HALF_OPEN
+        assert breaker.allow()
+    finally:
+        await breakers.close()
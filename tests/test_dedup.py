@@ -0,0 +1,54 @@
+import time
+import pytest
+from app.schemas.alerts import Alert, Severity
+from app.utils import dedup
+from app.utils.dedup import Deduplicator, alert_fingerprint, get_deduplicator
+
+@pytest.fixture
+def deduplication(config):
+    dedup.deduplicator = None
+    dedup.deduplicator_settings = None
+    config(dedup={'window_seconds': 60, 'max_entries': 100})
+    yield config
+    dedup.deduplicator = None
+    dedup.deduplicator_settings = None
+
+def test_reload_keeps_the_fingerprints_seen(deduplication):
+    deduplicator = get_deduplicator()
+    assert not deduplicator.check('fingerprint')
+
+    deduplication(dedup={'window_seconds': 60, 'max_entries': 100})
+    assert get_deduplicator() is deduplicator
+    assert deduplicator.check('fingerprint')
+
+    deduplication(dedup={'window_seconds': 30, 'max_entries': 100})
+    assert get_deduplicator() is deduplicator
+    assert deduplicator.seen.ttl == 30
+    assert deduplicator.check('fingerprint')
+
+def test_fingerprints_expire_after_the_window():
+    deduplicator = Deduplicator(window=0.05, max_entries=100)
+    assert not deduplicator.check('fingerprint')
+    assert deduplicator.check('fingerprint')
+    time.sleep(0.06)
+    assert not deduplicator.check('fingerprint')
+    assert deduplicator.suppressed == 1
+
+def test_oldest_fingerprints_are_evicted_when_full():
+    deduplicator = Deduplicator(window=60, max_entries=2)
+    for fingerprint in ('first', 'second', 'third'):
+        deduplicator.check(fingerprint)
+    assert not deduplicator.check('first')
+    assert deduplicator.check('third')
+
+def test_forgotten_fingerprint_is_accepted_again():
+    deduplicator = Deduplicator(window=60, max_entries=100)
+    deduplicator.check('fingerprint')
+    deduplicator.forget('fingerprint')
+    assert not deduplicator.check('fingerprint')
+
+def test_fingerprint_prefers_the_dedup_key():
+    alert = Alert(queue_id=1, title='Disk full', message='The disk is full', severity=Severity('critical'))
+    assert alert_fingerprint(alert) == alert_fingerprint(alert.model_copy(update={'message': 'Still full'}))
+    assert alert_fingerprint(alert) != alert_fingerprint(alert.model_copy(update={'severity': Severity('ok')}))
+    assert alert_fingerprint(alert.model_copy(update={'dedup_key': 'db-1'})) == '1:db-1'
@@ -0,0 +1,65 @@
+import asyncio
+from types import SimpleNamespace
+from app.utils.config import get_config
+from app.utils.dispatcher import Dispatcher
+
+class RecordingSender:
+    def __init__(self, error: Exception = None):
+        self.sent = []
+        self.digests = []
+        self.error = error
+
+    async def send(self, services, renderer):
+        self.sent.append(renderer.message)
+
+    async def send_digest(self, services, messages):
+        if self.error:
+            raise self.error
+        self.digests.append(messages)
+
+def renderer(number: int) -> SimpleNamespace:
+    return SimpleNamespace(message=f'alert {number}')
+
+def test_reload_keeps_the_destination(config):
+    config(dispatch={'webhook': {'rate': 0.001, 'burst': 1}})
+    sender = RecordingSender()
+    dispatcher = Dispatcher(sender.send, sender.send_digest)
+    services = [get_config().services_by_id[1]]
+    destination = dispatcher.get_destination(services)
+    assert not destination.bucket.consume()
+
+    config(dispatch={'webhook': {'rate': 0.001, 'burst': 1}})
+    assert dispatcher.get_destination([get_config().services_by_id[1]]) is destination
+    assert destination.bucket.consume()
+
+    config(dispatch={'webhook': {'rate': 0.001, 'burst': 3}})
+    assert dispatcher.get_destination([get_config().services_by_id[1]]) is destination
+    assert destination.bucket.capacity == 3
+
+async def test_saturated_destination_receives_a_digest(config):
+    config(dispatch={'webhook': {'rate': 20, 'burst': 1}, 'max_digest_size': 2})
+    sender = RecordingSender()
+    dispatcher = Dispatcher(sender.send, sender.send_digest)
+    services = [get_config().services_by_id[1]]
+    await asyncio.gather(*(dispatcher.dispatch(services, renderer(number)) for number in range(4)))
+    assert sender.sent == ['alert 0', 'alert 3']
+    assert sender.digests == [['alert 1', 'alert 2']]
+
+async def test_failed_digest_fails_every_alert_in_it(config):
+    config(dispatch={'webhook': {'rate': 20, 'burst': 1}})
+    sender = RecordingSender(RuntimeError("Webhook returned 500"))
+    dispatcher = Dispatcher(sender.send, sender.send_digest)
+    services = [get_config().services_by_id[1]]
+    results = await asyncio.gather(
+        *(dispatcher.dispatch(services, renderer(number)) for number in range(3)), return_exceptions=True
+    )
+    assert results[0] is None
+    assert all(isinstance(result, RuntimeError) for result in results[1:])
+
+async def test_unlimited_destination_sends_each_alert(config):
+    sender = RecordingSender()
+    dispatcher = Dispatcher(sender.send, sender.send_digest)
+    services = [get_config().services_by_id[1]]
+    await asyncio.gather(*(dispatcher.dispatch(services, renderer(number)) for number in range(3)))
+    assert sender.sent == ['alert 0', 'alert 1', 'alert 2']
+    assert not sender.digests
@@ -0,0 +1,64 @@
+import orjson
+import pytest
+from app.schemas.alerts import Alert, Severity
+from app.utils import envelope
+from app.utils.envelope import (
+    CONTENT_ENCODING_HEADER, CONTENT_TYPE_HEADER, JSON_CONTENT_TYPE, MSGPACK_CONTENT_TYPE, ZLIB_ENCODING,
+    VERSION_HEADER, decode_message, encode_alert
+)
+
+ALERT = Alert(
+    queue_id=1, title='Disk full', message='The disk on **db-1** is full', severity=Severity('critical'),
+    url='https://example.com/db-1', dedup_key='db-1-disk'
+)
+
+def assert_decodes_to_alert(message):
+    assert message.queue_id == ALERT.queue_id
+    assert message.title == ALERT.title
+    assert message.message == ALERT.message
+    assert message.severity is ALERT.severity
+    assert message.url == ALERT.url
+    assert message.dedup_key == ALERT.dedup_key
+    assert message.tagged_users is None
+
+@pytest.mark.parametrize('body_format, content_type', [
+    ('json', JSON_CONTENT_TYPE),
+    ('msgpack', MSGPACK_CONTENT_TYPE),
+])
+@pytest.mark.parametrize('compress_threshold, compressed', [
+    (None, False),
+    (0, True),
+])
+def test_encoded_alert_round_trips(config, body_format, content_type, compress_threshold, compressed):
+    if body_format == 'msgpack':
+        pytest.importorskip('msgpack')
+    config(envelope={'format': body_format, 'compress_threshold': compress_threshold})
+    body, headers = encode_alert(ALERT)
+    assert headers[CONTENT_TYPE_HEADER] == content_type
+    assert (headers.get(CONTENT_ENCODING_HEADER) == ZLIB_ENCODING) is compressed
+    assert_decodes_to_alert(decode_message(body, headers))
+
+def test_small_bodies_are_not_compressed(config):
+    config(envelope={'compress_threshold': 4096})
+    body, headers = encode_alert(ALERT)
+    assert CONTENT_ENCODING_HEADER not in headers
+    assert orjson.loads(body)['title'] == ALERT.title
+
+def test_msgpack_falls_back_to_json_without_the_package(config, monkeypatch):
+    monkeypatch.setattr(envelope, 'msgpack', None)
+    config(envelope={'format': 'msgpack'})
+    body, headers = encode_alert(ALERT)
+    assert headers[CONTENT_TYPE_HEADER] == JSON_CONTENT_TYPE
+    assert_decodes_to_alert(decode_message(body, headers))
+
+def test_legacy_body_without_envelope_headers_is_read_as_json():
+    body = orjson.dumps(ALERT.model_dump(mode='json'))
+    assert_decodes_to_alert(decode_message(body, {'service_ids': [1]}))
+
+def test_newer_envelope_version_is_rejected():
+    with pytest.raises(ValueError):
+        decode_message(b'{}', {VERSION_HEADER: 99})
+
+def test_unknown_content_encoding_is_rejected():
+    with pytest.raises(ValueError):
+        decode_message(b'{}', {CONTENT_ENCODING_HEADER: 'br'})
@@ -0,0 +1,34 @@
+from app.schemas.alerts import Alert
+from app.utils import gateway
+from app.utils.broker import MemoryMessage
+from app.utils.envelope import encode_alert
+
+SERVICES = [
+    {'id': 1, 'name': 'first', 'description': 'A webhook', 'type': 'webhook', 'recipient': 'http://127.0.0.1:9/first'},
+    {'id': 2, 'name': 'second', 'description': 'A webhook', 'type': 'webhook', 'recipient': 'http://127.0.0.1:9/second'},
+]
+
+def consumed_message(broker, service_ids: list) -> MemoryMessage:
+    body, headers = encode_alert(Alert(queue_id=1, title='Disk full', message='The disk is full'))
+    return MemoryMessage(broker, 'alerts', body, {**headers, 'service_ids': service_ids}, 0)
+
+async def test_failed_retry_is_retried_for_the_failed_services_only(config, broker, monkeypatch):
+    config(services=SERVICES)
+    retries = []
+
+    async def deliver_or_hold(message, services, renderer, alert_id, attempt):
+        if services[0]['id'] == 2:
+            raise RuntimeError("Webhook returned 500")
+
+    async def schedule_retry(queue_name, body, headers, service_ids, error=None):
+        retries.append(service_ids)
+        if len(retries) == 1:
+            raise RuntimeError("Channel closed")
+        return False
+
+    monkeypatch.setattr(gateway, 'deliver_or_hold', deliver_or_hold)
+    monkeypatch.setattr(gateway, 'schedule_retry', schedule_retry)
+    message = consumed_message(broker, [1, 2])
+    await gateway.on_message(message)
+    assert retries == [[2], [2]]
+    assert message.settled
@@ -0,0 +1,21 @@
+from app.utils import handlers
+
+class RecordingPool:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, message, sender, recipients):
+        self.sent.append((message, recipients))
+
+async def test_grouped_email_does_not_disclose_its_recipients(config, monkeypatch):
+    config(smtp_server='smtp.example.com', smtp_from_address='wuphf@example.com')
+    pool = RecordingPool()
+    monkeypatch.setattr(handlers, 'get_smtp_pool', lambda: pool)
+
+    await handlers.send_smtp_email(['ops@example.com', 'billing@example.com'], ('Disk full', '<p>The disk is full</p>'))
+    message, recipients = pool.sent[0]
+    assert recipients == ['ops@example.com', 'billing@example.com']
+    assert message['To'] == 'undisclosed-recipients:;'
+
+    await handlers.send_smtp_email(['ops@example.com'], ('Disk full', '<p>The disk is full</p>'))
+    assert pool.sent[1][0]['To'] == 'ops@example.com'
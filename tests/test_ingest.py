@@ -0,0 +1,36 @@
+import asyncio
+from app.utils.broker import MemoryBroker
+from app.utils.ingest import IngestBuffer
+from app.utils import broker as broker_module
+
+class StalledBroker(MemoryBroker):
+    """
+    A broker that never confirms a batch.
+    """
+    async def publish_batch(self, queue_name, messages):
+        await asyncio.Event().wait()
+
+async def test_close_publishes_buffered_alerts(broker):
+    buffer = IngestBuffer(flush_interval=60, batch_size=2)
+    buffer.start()
+    for number in range(5):
+        buffer.submit('alerts', f'alert {number}'.encode(), {})
+    await buffer.close(timeout=5)
+    assert len(buffer) == 0
+    bodies = []
+    while (message := await broker.get('alerts')) is not None:
+        bodies.append(message.body)
+    assert bodies == [f'alert {number}'.encode() for number in range(5)]
+
+async def test_close_timeout_keeps_the_batch_being_published(config):
+    broker_module.broker = StalledBroker()
+    try:
+        buffer = IngestBuffer(flush_interval=0.001, batch_size=2)
+        buffer.start()
+        for number in range(3):
+            buffer.submit('alerts', f'alert {number}'.encode(), {})
+        await asyncio.sleep(0.05)
+        await buffer.close(timeout=0.1)
+        assert [body for _, body, _ in buffer.messages] == [f'alert {number}'.encode() for number in range(3)]
+    finally:
+        broker_module.broker = None
@@ -0,0 +1,53 @@
+import sqlite3
+import pytest
+from app.utils.outbox import Outbox, OutboxFull
+
+async def test_drain_recovers_from_a_database_error(broker, tmp_path, wait_until):
+    outbox = Outbox(str(tmp_path / "outbox.db"), retry_interval=0.01)
+    await outbox.open()
+    read = outbox._read
+    failures = []
+
+    def locked_once(limit):
+        if not failures:
+            failures.append(limit)
+            raise sqlite3.OperationalError("database is locked")
+        return read(limit)
+
+    outbox._read = locked_once
+    try:
+        for number in range(3):
+            await outbox.append('alerts', f'alert {number}'.encode(), {})
+        await wait_until(lambda: not outbox.count)
+        assert failures
+        assert not outbox.drain_task.done()
+        assert outbox.size == 0
+        bodies = [(await broker.get('alerts')).body for _ in range(3)]
+        assert bodies == [f'alert {number}'.encode() for number in range(3)]
+    finally:
+        await outbox.close()
+
+async def test_drain_resynchronizes_a_count_the_database_does_not_hold(broker, tmp_path, wait_until):
+    outbox = Outbox(str(tmp_path / "outbox.db"), retry_interval=0.01)
+    await outbox.open()
+    try:
+        outbox.count, outbox.size = 2, 100
+        outbox.wakeup.set()
+        await wait_until(lambda: not outbox.count)
+        assert outbox.size == 0
+        assert not outbox.active
+        assert not outbox.drain_task.done()
+    finally:
+        await outbox.close()
+
+async def test_a_batch_being_written_counts_towards_the_outbox(broker, tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.db"), max_messages=1)
+    await outbox.open()
+    try:
+        outbox.writing = [(('alerts', b'alert', b'{}', 0), None)]
+        assert outbox.active
+        with pytest.raises(OutboxFull):
+            await outbox.append('alerts', b'one too many', {})
+    finally:
+        outbox.writing = []
+        await outbox.close()
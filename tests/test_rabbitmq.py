@@ -0,0 +1,36 @@
+from types import SimpleNamespace
+from aio_pika.pool import Pool
+from app.utils import rabbitmq
+
+class FakeChannel:
+    """
+    A pooled channel whose queue depth is read with passive declares on its underlying channel.
+    """
+    def __init__(self, depths: list):
+        self.depths = depths
+        self.declares = 0
+
+    async def get_underlay_channel(self):
+        return self
+
+    async def queue_declare(self, queue_name, passive=False):
+        assert passive
+        self.declares += 1
+        return SimpleNamespace(message_count=self.depths.pop(0))
+
+    async def close(self):
+        pass
+
+async def test_refresh_queue_depth_asks_the_broker_each_time(config, monkeypatch):
+    channel = FakeChannel([100, 40])
+
+    async def create_channel():
+        return channel
+
+    monkeypatch.setattr(rabbitmq, 'channel_pool', Pool(create_channel, max_size=1))
+    monkeypatch.setattr(rabbitmq, 'queue_depths', {})
+    await rabbitmq.refresh_queue_depth('alerts')
+    assert rabbitmq.queue_depths['alerts'][0] == 100
+    await rabbitmq.refresh_queue_depth('alerts')
+    assert rabbitmq.queue_depths['alerts'][0] == 40
+    assert channel.declares == 2
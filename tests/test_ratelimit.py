@@ -0,0 +1,61 @@
+import math
+import time
+import pytest
+from fastapi import HTTPException
+from app.utils import ratelimit
+from app.utils.config import hash_api_key
+from app.utils.ratelimit import TokenBucket, enforce_batch_rate_limit, enforce_rate_limit, get_api_key_bucket
+
+DIGEST = hash_api_key('test-key')
+
+@pytest.fixture
+def rate_limited(config, monkeypatch):
+    monkeypatch.setattr(ratelimit, 'api_key_buckets', {})
+    config(rate_limits={'default': {'rate': 0.001, 'burst': 2}})
+    return config
+
+def test_reload_keeps_the_tokens_left(rate_limited):
+    bucket = get_api_key_bucket(DIGEST)
+    assert bucket.take(2) == 2
+
+    rate_limited(rate_limits={'default': {'rate': 0.001, 'burst': 2}})
+    assert get_api_key_bucket(DIGEST) is bucket
+    assert bucket.consume()
+
+    rate_limited(rate_limits={'default': {'rate': 0.001, 'burst': 5}})
+    assert get_api_key_bucket(DIGEST) is bucket
+    assert bucket.capacity == 5
+    assert bucket.consume()
+
+def test_bucket_refills_at_its_rate_up_to_its_capacity():
+    bucket = TokenBucket(rate=100, capacity=2)
+    assert bucket.consume() == 0
+    assert bucket.consume() == 0
+    assert bucket.consume() == pytest.approx(0.01, rel=0.5)
+    time.sleep(0.05)
+    assert bucket.take(5) == 2
+
+def test_bucket_without_a_rate_never_refills():
+    bucket = TokenBucket(rate=0, capacity=1)
+    assert bucket.consume() == 0
+    assert bucket.consume() == math.inf
+
+def test_exhausted_key_is_rejected_with_retry_after(rate_limited):
+    assert enforce_rate_limit(DIGEST) == DIGEST
+    assert enforce_rate_limit(DIGEST) == DIGEST
+    with pytest.raises(HTTPException) as error:
+        enforce_rate_limit(DIGEST)
+    assert error.value.status_code == 429
+    assert int(error.value.headers['Retry-After']) == 1000
+
+def test_batch_is_charged_one_token_per_alert(rate_limited):
+    assert enforce_batch_rate_limit(DIGEST, 5) == 2
+    with pytest.raises(HTTPException) as error:
+        enforce_batch_rate_limit(DIGEST, 1)
+    assert error.value.status_code == 429
+    assert 'Retry-After' in error.value.headers
+
+def test_key_without_limits_is_not_rate_limited(config, monkeypatch):
+    monkeypatch.setattr(ratelimit, 'api_key_buckets', {})
+    assert enforce_batch_rate_limit(DIGEST, 1000) == 1000
+    assert enforce_rate_limit(DIGEST) == DIGEST
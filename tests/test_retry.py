@@ -0,0 +1,49 @@
+import pytest
+from app.utils.broker import queue_arguments
+from app.utils.retry import ATTEMPT_HEADER, ERROR_HEADER, register_retry_queues, schedule_retry
+
+@pytest.fixture
+def retries(config, broker, monkeypatch):
+    config(retry={'delays': [0.01, 0.02], 'max_attempts': 4})
+    saved = dict(queue_arguments)
+    targets = []
+    publish = broker.publish
+
+    async def recording_publish(queue_name, body, headers=None, **kwargs):
+        targets.append(queue_name)
+        await publish(queue_name, body, headers, **kwargs)
+
+    monkeypatch.setattr(broker, 'publish', recording_publish)
+    register_retry_queues('alerts')
+    yield targets
+    queue_arguments.clear()
+    queue_arguments.update(saved)
+
+async def test_retry_tiers_follow_the_attempt(broker, retries, wait_until):
+    parked = await schedule_retry('alerts', b'alert', {'service_ids': [1, 2], 'x-death': []}, [2], "Webhook returned 500")
+    assert not parked
+    await schedule_retry('alerts', b'alert', {ATTEMPT_HEADER: 1}, [2])
+    await schedule_retry('alerts', b'alert', {ATTEMPT_HEADER: 2}, [2])
+    assert retries == ['alerts.retry.0.01s', 'alerts.retry.0.02s', 'alerts.retry.0.02s']
+
+    # Each tier dead-letters the message back onto its queue once its delay has passed
+    await wait_until(lambda: broker.get_queue_depth('alerts') == 3)
+    message = await broker.get('alerts')
+    assert message.headers[ATTEMPT_HEADER] == 1
+    assert message.headers['service_ids'] == [2]
+    assert message.headers[ERROR_HEADER] == "Webhook returned 500"
+    assert 'x-death' not in message.headers
+
+async def test_message_is_parked_after_the_last_attempt(broker, retries):
+    parked = await schedule_retry('alerts', b'alert', {ATTEMPT_HEADER: 3}, [1])
+    assert parked
+    assert retries == ['alerts.parked']
+    message = await broker.get('alerts.parked')
+    assert message.headers[ATTEMPT_HEADER] == 4
+
+async def test_delays_changed_on_reload_register_their_tiers(config, broker, retries, wait_until):
+    config(retry={'delays': [0.03], 'max_attempts': 4})
+    await schedule_retry('alerts', b'alert', {}, [1])
+    assert retries == ['alerts.retry.0.03s']
+    assert 'alerts.retry.0.03s' in queue_arguments
+    await wait_until(lambda: broker.get_queue_depth('alerts') == 1)